@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Micro-benchmark for WebInspect scan payload construction.
+# Usage: python tests/benchmark_payload.py [iterations]
+
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webbreaker.webinspectjson import formatted_settings_payload
+
+
+def build(index=0):
+    return formatted_settings_payload('Default', 'benchmark-{}'.format(index), None, 'all', 'strict',
+                                      'login' if index % 2 else None, None, 'url',
+                                      ['https://example.com/{}'.format(index)], ['workflow-{}'.format(index)],
+                                      ['example.com'])
+
+
+def check_isolation(threads=8, per_thread=500):
+    """
+    Build payloads from several threads at once and make sure no override leaks between them.
+    """
+    errors = []
+
+    def worker(offset):
+        for i in range(offset, offset + per_thread):
+            payload = build(i)
+            overrides = payload['overrides']
+            if overrides['scanName'] != 'benchmark-{}'.format(i) or \
+                    overrides['startUrls'] != ['https://example.com/{}'.format(i)] or \
+                    ('loginMacro' in overrides) != bool(i % 2):
+                errors.append(i)
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    seconds = min(timeit.repeat(build, number=iterations, repeat=3))
+    sys.stdout.write("formatted_settings_payload: {0:.2f} us per payload ({1} iterations)\n".format(
+        seconds / iterations * 1e6, iterations))
+
+    leaks = check_isolation()
+    if leaks:
+        sys.stdout.write("{} payloads built concurrently had overrides from another scan\n".format(len(leaks)))
+        sys.exit(1)
+    sys.stdout.write("Concurrent payload construction is isolated\n")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Cold-start benchmark for the WebBreaker CLI. Each subcommand's dispatch cost, importing the CLI together with the
+# banner and the modules the command imports when it runs, is timed in a fresh interpreter. The best wall time, minus
+# the cost of starting a bare interpreter, is compared to the subcommand's budget.
+# Usage: python tests/benchmark_startup.py [runs]
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLI = ['webbreaker.__main__', 'pyfiglet']
+FORTIFY = CLI + ['webbreaker.fortifytokenmanager', 'webbreaker.fortifyclient', 'webbreaker.fortifyconfig']
+# (subcommand, modules imported when it is dispatched, seconds allowed on top of a bare interpreter). Budgets are
+# the slowest of five best-of-10 or best-of-20 rounds with Python 3.11 on a single CPU, plus about 50% headroom.
+BUDGETS = [
+    ('--help', None, 0.2),
+    ('webinspect scan', CLI + ['webbreaker.webinspectconfig', 'webbreaker.webinspectclient',
+                               'webbreaker.webinspectscanindex', 'webbreaker.webinspectscanhelpers',
+                               'webbreaker.webbreakermetrics'], 0.45),
+    ('webinspect list', CLI + ['webbreaker.webinspectqueryclient', 'webbreaker.webinspectscanindex'], 0.4),
+    ('webinspect download', CLI + ['webbreaker.webinspectqueryclient', 'webbreaker.webinspectscanindex'], 0.4),
+    ('fortify list', FORTIFY, 0.45),
+    ('fortify upload', FORTIFY, 0.45),
+    ('fortify scan', FORTIFY + ['webbreaker.gitclient'], 0.45),
+    ('admin notifier', CLI + ['webbreaker.gitclient'], 0.45),
+    ('admin agent', CLI + ['webbreaker.gitclient', 'webbreaker.webbreakeragent.agent'], 0.45),
+]
+
+
+def command(args, modules):
+    if modules is None:
+        return [sys.executable, '-m', 'webbreaker'] + args.split()
+    return [sys.executable, '-c', '; '.join('import ' + module for module in modules)]
+
+
+def best_of(command, runs):
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call(command, cwd=ROOT, stdout=open(os.devnull, 'w'))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(runs, out=sys.stdout):
+    """
+    :return: Subcommands over their startup budget
+    """
+    baseline = best_of([sys.executable, '-c', 'pass'], runs)
+    out.write("bare interpreter: {0:.3f}s\n".format(baseline))
+
+    over_budget = []
+    for args, modules, budget in BUDGETS:
+        elapsed = best_of(command(args, modules), runs) - baseline
+        name = 'webbreaker ' + args
+        out.write("{0:40} {1:.3f}s (budget {2:.3f}s)\n".format(name, elapsed, budget))
+        if elapsed > budget:
+            over_budget.append(name)
+    return over_budget
+
+
+if __name__ == '__main__':
+    over_budget = run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    if over_budget:
+        sys.stdout.write("Over startup budget: {}\n".format(", ".join(over_budget)))
+        sys.exit(1)
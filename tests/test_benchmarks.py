@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_payload_isolation():
+    import benchmark_payload
+
+    assert benchmark_payload.check_isolation(threads=4, per_thread=100) == []
+
+
+def test_startup_budgets():
+    # Dispatch imports the subsystem modules and their third-party dependencies
+    for module in ['click', 'pyfiglet', 'requests', 'cryptography', 'webinspectapi']:
+        pytest.importorskip(module)
+    import benchmark_startup
+
+    assert benchmark_startup.run(3, out=open(os.devnull, 'w')) == []
@@ -0,0 +1,93 @@
+import json
+import pytest
+try:
+    import urllib.request as urllib2
+    from urllib.error import HTTPError
+except ImportError:  # Python2
+    import urllib2
+    from urllib2 import HTTPError
+
+# The intake server imports the git client, which needs requests
+pytest.importorskip('requests')
+from webbreaker.gitclient import TOKEN_HEADER
+from webbreaker.webbreakeragent.intake import start_intake_server
+
+TOKEN = 'secret'
+SUBMISSION = {'git_emails': ['dev@example.com'], 'git_url': 'https://github.example.com/org/repo',
+              'fortify_pv_url': 'https://ssc.example.com/ssc/html/ssc/version/1', 'fortify_build_id': 'build-1'}
+
+
+@pytest.fixture
+def intake():
+    submitted = []
+
+    def submit(data):
+        submitted.append(data)
+        return 'job-{}'.format(len(submitted))
+
+    server = start_intake_server(('127.0.0.1', 0), submit, token=TOKEN)
+    yield server, submitted
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body, token=TOKEN, content_type='application/json'):
+    headers = {'Content-Type': content_type}
+    if token is not None:
+        headers[TOKEN_HEADER] = token
+    request = urllib2.Request('http://127.0.0.1:{}/'.format(server.server_address[1]), data=body, headers=headers)
+    try:
+        response = urllib2.urlopen(request, timeout=5)
+    except HTTPError as e:
+        response = e
+    return response.getcode(), json.loads(response.read().decode('utf-8'))
+
+
+def test_accepts_valid_submission(intake):
+    server, submitted = intake
+    code, payload = post(server, json.dumps(SUBMISSION).encode('utf-8'))
+
+    assert code == 202
+    assert payload == {'job_id': 'job-1'}
+    assert submitted == [SUBMISSION]
+
+
+def test_accepts_form_submission(intake):
+    server, submitted = intake
+    body = 'git_emails=a%40example.com&git_emails=b%40example.com&git_url=u&fortify_pv_url=p&fortify_build_id=b'
+    code, payload = post(server, body.encode('utf-8'), content_type='application/x-www-form-urlencoded')
+
+    assert code == 202
+    assert submitted[0]['git_emails'] == ['a@example.com', 'b@example.com']
+
+
+@pytest.mark.parametrize('token', [None, 'wrong', u'été'.encode('utf-8').decode('latin-1')])
+def test_rejects_bad_token(intake, token):
+    server, submitted = intake
+    code, payload = post(server, json.dumps(SUBMISSION).encode('utf-8'), token=token)
+
+    assert code == 401
+    assert submitted == []
+
+
+@pytest.mark.parametrize('field, value', [('git_emails', None), ('git_emails', 'dev@example.com'),
+                                          ('git_emails', []), ('git_emails', [1]), ('git_url', ''),
+                                          ('fortify_build_id', None), ('fortify_pv_url', ['p'])])
+def test_rejects_invalid_fields(intake, field, value):
+    server, submitted = intake
+    submission = dict(SUBMISSION)
+    submission[field] = value
+    code, payload = post(server, json.dumps(submission).encode('utf-8'))
+
+    assert code == 400
+    assert field in payload['error']
+    assert submitted == []
+
+
+@pytest.mark.parametrize('body', [b'{"git_emails": ', b'[]', b'\xff\xfe'])
+def test_rejects_unparsable_body(intake, body):
+    server, submitted = intake
+    code, payload = post(server, body)
+
+    assert code == 400
+    assert submitted == []
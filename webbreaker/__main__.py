@@ -22,29 +22,19 @@ except:
     import urllib
 import sys
 import datetime
-import requests.exceptions
 import json
-from git.exc import GitCommandError
 import click
-from pyfiglet import Figlet
 from webbreaker import __version__ as version
 from webbreaker.webbreakerlogger import Logger
-from webbreaker.webinspectconfig import WebInspectConfig
-from webbreaker.webinspectclient import WebinspectClient
-from webbreaker.webinspectqueryclient import WebinspectQueryClient
-from webbreaker.fortifyclient import FortifyClient
-from webbreaker.fortifyconfig import FortifyConfig
-from webbreaker.webinspectscanhelpers import create_scan_event_handler
-from webbreaker.webinspectscanhelpers import scan_running
 from webbreaker.webbreakerhelper import WebBreakerHelper
-from webbreaker.gitclient import GitClient, GitUploader, write_agent_info, read_agent_info, AgentVerifier
-from webbreaker.secretclient import SecretClient
 import re
 import sys
-import subprocess
+
+# Subsystem modules (and their third-party dependencies) are imported inside each command when it is
+# dispatched, so help output and lightweight commands don't pay for the whole application at startup.
+# tests/benchmark_startup.py enforces the startup budget per subcommand.
 
 handle_scan_event = None
-reporter = None
 
 
 class Config(object):
@@ -60,13 +50,42 @@ def fortify_prompt():
     return fortify_user, fortify_password
 
 
+def fortify_token_manager(fortify_config, fortify_user=None, fortify_password=None):
+    """
+    Credentials given on the command line always get a fresh token, otherwise the token and credentials stored in
+    fortify.ini are used, prompting only when nothing usable is stored. New tokens are written back to fortify.ini.
+    """
+    from webbreaker.fortifytokenmanager import FortifyTokenManager
+
+    def write_secret(**secrets):
+        fortify_config.write_credentials(**secrets)
+        Logger.console.info("Fortify secret written to fortify.ini")
+
+    if fortify_user and fortify_password:
+        return FortifyTokenManager(fortify_config.ssc_url, username=fortify_user, password=fortify_password,
+                                   prompt=fortify_prompt, on_refresh=write_secret)
+
+    Logger.console.info("No Fortify username or password provided. Checking fortify.ini for secret")
+    if fortify_config.token or fortify_config.has_auth_creds():
+        Logger.console.info("Fortify secret found in fortify.ini")
+    else:
+        Logger.console.info("Fortify secret not found in fortify.ini")
+    return FortifyTokenManager(fortify_config.ssc_url, token=fortify_config.token,
+                               token_expiry=fortify_config.token_expiry, username=fortify_config.username,
+                               password=fortify_config.password, prompt=fortify_prompt, on_refresh=write_secret)
+
+
 @click.group(help=WebBreakerHelper.help_description())
 @pass_config
 def cli(config):
-    # Show something pretty to start
+    # Help output doesn't need the banner
+    if '--help' in sys.argv[1:]:
+        return
+    # Show something pretty to start, on stderr so stdout stays machine readable (e.g. fortify list --output json)
+    from pyfiglet import Figlet
     f = Figlet(font='slant')
-    sys.stdout.write(str("{0}Version {1}\n".format(f.renderText('WebBreaker'), version)))
-    sys.stdout.write(str("Logging to files: {}".format(Logger.app_logfile)))
+    sys.stderr.write(str("{0}Version {1}\n".format(f.renderText('WebBreaker'), version)))
+    sys.stderr.write(str("Logging to files: {}\n".format(Logger.app_logfile)))
 
 @cli.group(help="""WebInspect is dynamic application security testing software for assessing security of Web
 applications and Web services.""")
@@ -154,6 +173,15 @@ def webinspect(config):
                     available on the WebInspect scanner to be used.""")
 @pass_config
 def scan(config, **kwargs):
+    import requests.exceptions
+    from git.exc import GitCommandError
+    from webbreaker.webinspectconfig import WebInspectConfig
+    from webbreaker.webinspectclient import WebinspectClient
+    from webbreaker.webinspectscanindex import WebInspectScanIndex
+    from webbreaker.webinspectscanhelpers import create_scan_event_handler, scan_running
+    from webbreaker.webbreakermetrics import start_metrics, SCAN_PHASE, SCANS_RUNNING
+
+    start_metrics('scan')
     # Setup our configuration...
     webinspect_config = WebInspectConfig()
 
@@ -184,7 +212,7 @@ def scan(config, **kwargs):
 
     # The webinspect client is our point of interaction with the webinspect server farm
     try:
-        webinspect_client = WebinspectClient(webinspect_settings)
+        webinspect_client = WebinspectClient(webinspect_settings, config=webinspect_config)
     except (UnboundLocalError, EnvironmentError) as e:
         Logger.console.critical("Incorrect WebInspect configurations found!! See log {}".format(str(Logger.app_logfile)))
         Logger.app.critical("Incorrect WebInspect configurations found!! {}".format(str(e)))
@@ -234,25 +262,35 @@ def scan(config, **kwargs):
         webinspect_client.upload_policy()
 
     # ... And launch a scan.
+    scan_index = WebInspectScanIndex()
     try:
-        scan_id = webinspect_client.create_scan()
+        with SCAN_PHASE.time(phase='create'):
+            scan_id = webinspect_client.create_scan()
+        if scan_id:
+            scan_index.record_scan(scan_id, webinspect_client.launched_scan_name, webinspect_client.url)
 
         global handle_scan_event
         handle_scan_event = create_scan_event_handler(webinspect_client, scan_id, webinspect_settings)
         handle_scan_event('scan_start')
 
-        with scan_running():
-            webinspect_client.wait_for_scan_status_change(scan_id)  # execution waits here, blocking call
+        SCANS_RUNNING.inc()
+        try:
+            with scan_running(), SCAN_PHASE.time(phase='run'):
+                webinspect_client.wait_for_scan_status_change(scan_id)  # execution waits here, blocking call
+        finally:
+            SCANS_RUNNING.dec()
 
         status = webinspect_client.get_scan_status(scan_id)
+        scan_index.update_status(scan_id, status, end_time=datetime.datetime.now().isoformat())
         Logger.console.critical("Scan status has changed to {0}.".format(status))
         if status.lower() != 'complete':  # case insensitive comparison is tricky. this should be good enough for now
             Logger.console.critical('Scan is incomplete and is unrecoverable. WebBreaker will exit!!')
             handle_scan_event('scan_end')
             exit(1)
 
-        webinspect_client.export_scan_results(scan_id, 'fpr')
-        webinspect_client.export_scan_results(scan_id, 'xml')
+        with SCAN_PHASE.time(phase='export'):
+            webinspect_client.export_scan_results(scan_id, 'fpr')
+            webinspect_client.export_scan_results(scan_id, 'xml')
         handle_scan_event('scan_end')
 
         Logger.console.critical('Scan is complete.')
@@ -287,8 +325,9 @@ def scan(config, **kwargs):
 
 @webinspect.command('list')
 @click.option('--server',
-              required=True,
-              help="URL of webinspect server. For example --server sample.webinspect.com:8083")
+              required=False,
+              help="""URL of webinspect server. For example --server sample.webinspect.com:8083. If not provided,
+                    --scan_name is looked up in the local scan index instead""")
 @click.option('--scan_name',
               required=False,
               help="Only list scans matching this scan_name")
@@ -299,11 +338,32 @@ def scan(config, **kwargs):
               help="The protocol used to contact the webinspect server. Default protocol is https")
 @pass_config
 def webinspect_list(config, server, scan_name, protocol):
+    from webbreaker.webinspectqueryclient import WebinspectQueryClient
+    from webbreaker.webinspectscanindex import WebInspectScanIndex
+
+    scan_index = WebInspectScanIndex()
+    if not server:
+        if not scan_name:
+            Logger.console.error("Please provide --server, or --scan_name to search the local scan index.")
+            return
+        results = scan_index.find_by_name(scan_name)
+        if len(results):
+            Logger.console.info("Scans matching the name {} found in the local scan index.".format(scan_name))
+            Logger.console.info("{0:80} {1:40} {2:10} {3:50}".format('Scan Name', 'Scan ID', 'Scan Status', 'Server'))
+            Logger.console.info("{0:80} {1:40} {2:10} {3:50}\n".format('-' * 80, '-' * 40, '-' * 10, '-' * 50))
+            for match in results:
+                Logger.console.info("{0:80} {1:40} {2:10} {3:50}".format(match['Name'], match['ID'], match['Status'],
+                                                                        match['Server']))
+        else:
+            Logger.console.info("No scans matching the name {} were found in the local scan index.".format(scan_name))
+        return
+
     query_client = WebinspectQueryClient(host=server, protocol=protocol)
     try:
         if scan_name:
             results = query_client.get_scan_by_name(scan_name)
             if len(results):
+                scan_index.refresh(query_client.host, results)
                 Logger.console.info("Scans matching the name {} found.".format(scan_name))
                 Logger.console.info("{0:80} {1:40} {2:10}".format('Scan Name', 'Scan ID', 'Scan Status'))
                 Logger.console.info("{0:80} {1:40} {2:10}\n".format('-' * 80, '-' * 40, '-' * 10))
@@ -313,15 +373,25 @@ def webinspect_list(config, server, scan_name, protocol):
             else:
                 Logger.console.info("No scans matching the name {} were found.".format(scan_name))
         else:
-            query_client.list_scans()
+            scan_index.refresh(query_client.host, query_client.list_scans())
     except:
         Logger.console.info("Unable to complete command 'webinspect list'")
 
 
+def indexed_query_client(scan):
+    """
+    Build a query client for the server a scan from the local scan index was run on
+    """
+    from webbreaker.webinspectqueryclient import WebinspectQueryClient
+    server = urlparse(scan['Server'])
+    return WebinspectQueryClient(host=server.netloc, protocol=server.scheme)
+
+
 @webinspect.command()
 @click.option('--server',
-              required=True,
-              help="URL of webinspect server. For example --server sample.webinspect.com:8083")
+              required=False,
+              help="""URL of webinspect server. For example --server sample.webinspect.com:8083. If not provided,
+                    the server is resolved from the local scan index""")
 @click.option('--scan_name',
               required=True,
               help="Name of scan to be downloaded")
@@ -339,11 +409,41 @@ def webinspect_list(config, server, scan_name, protocol):
               help="The protocol used to contact the webinspect server. Default protocol is https")
 @pass_config
 def download(config, server, scan_name, scan_id, x, protocol):
-    query_client = WebinspectQueryClient(host=server, protocol=protocol)
+    from webbreaker.webinspectqueryclient import WebinspectQueryClient
+    from webbreaker.webinspectscanindex import WebInspectScanIndex
+
+    scan_index = WebInspectScanIndex()
 
     try:
+        if not server:
+            if scan_id:
+                match = scan_index.find_by_id(scan_id)
+                search_results = [match] if match else []
+            else:
+                search_results = scan_index.find_by_name(scan_name)
+            if len(search_results) == 0:
+                Logger.console.info("No scans matching the name {} were found in the local scan index. "
+                                    "Please provide --server".format(scan_name))
+            elif len(search_results) == 1:
+                scan_id = search_results[0]['ID']
+                query_client = indexed_query_client(search_results[0])
+                Logger.console.info(
+                    "Scan matching the name {} found.\nDownloading scan {} ...".format(scan_name, scan_id))
+                query_client.export_scan_results(scan_id, scan_name, x)
+            else:
+                Logger.console.info("Multiple scans matching the name {} found.".format(scan_name))
+                Logger.console.info("{0:80} {1:40} {2:10} {3:50}".format('Scan Name', 'Scan ID', 'Scan Status',
+                                                                        'Server'))
+                Logger.console.info("{0:80} {1:40} {2:10} {3:50}\n".format('-' * 80, '-' * 40, '-' * 10, '-' * 50))
+                for result in search_results:
+                    Logger.console.info("{0:80} {1:40} {2:10} {3:50}".format(result['Name'], result['ID'],
+                                                                            result['Status'], result['Server']))
+            return
+
+        query_client = WebinspectQueryClient(host=server, protocol=protocol)
         if not scan_id:
             search_results = query_client.get_scan_by_name(scan_name)
+            scan_index.refresh(query_client.host, search_results)
             if len(search_results) == 0:
                 Logger.console.info("No scans matching the name {} where found on this host".format(scan_name))
             elif len(search_results) == 1:
@@ -380,72 +480,28 @@ def fortify(config):
               required=False,
               help="Name of Fortify application which you would like to list versions of."
               )
+@click.option('--output',
+              required=False,
+              type=click.Choice(['table', 'json', 'csv']),
+              default='table',
+              help="Print versions as a table (default), a JSON array or CSV")
 @pass_config
-def fortify_list(config, fortify_user, fortify_password, application):
+def fortify_list(config, fortify_user, fortify_password, application, output):
+    from webbreaker.fortifyclient import FortifyClient
+    from webbreaker.fortifyconfig import FortifyConfig
+
     fortify_config = FortifyConfig()
     try:
-        if not fortify_user or not fortify_password:
-            Logger.console.info("No Fortify username or password provided. Checking fortify.ini for secret")
-            if fortify_config.token or fortify_config.has_auth_creds():
-                Logger.console.info("Fortify secret found in fortify.ini")
-                fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url, token=fortify_config.token,
-                                               fortify_username=fortify_config.username, fortify_password=fortify_config.password)
-                fortify_config.write_token(fortify_client.token)
-            else:
-                Logger.console.info("Fortify secret not found in fortify.ini")
-                fortify_user, fortify_password = fortify_prompt()
-                fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url, fortify_username=fortify_user,
-                                               fortify_password=fortify_password)
-                fortify_config.write_token(fortify_client.token)
-                fortify_config.write_username(fortify_user)
-                fortify_config.write_password(fortify_password)
-                Logger.console.info("Fortify secret written to fortify.ini")
-            if application:
-                reauth = fortify_client.list_application_versions(application)
-                if reauth == -1 and fortify_config.token:
-                    Logger.console.info("Fortify secret invalid...reauthorizing")
-                    if fortify_config.has_auth_creds():
-                        fortify_user = fortify_config.username
-                        fortify_password = fortify_config.password
-                    else:
-                        fortify_user, fortify_password = fortify_prompt()
-                    fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url, fortify_username=fortify_user,
-                                                   fortify_password=fortify_password)
-                    fortify_config.write_username(fortify_user)
-                    fortify_config.write_password(fortify_password)
-                    fortify_config.write_token(fortify_client.token)
-                    Logger.console.info("Fortify secret written to fortify.ini")
-                    Logger.console.info("Attempting to rerun 'fortify list --application'")
-                    fortify_client.list_application_versions(application)
-            else:
-                reauth = fortify_client.list_versions()
-                if reauth == -1 and fortify_config.token:
-                    Logger.console.info("Fortify secret invalid...reauthorizing")
-                    if fortify_config.has_auth_creds():
-                        fortify_user = fortify_config.username
-                        fortify_password = fortify_config.password
-                    else:
-                        fortify_user, fortify_password = fortify_prompt()
-                    fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url, fortify_username=fortify_user,
-                                                   fortify_password=fortify_password)
-                    fortify_config.write_username(fortify_user)
-                    fortify_config.write_password(fortify_password)
-                    fortify_config.write_token(fortify_client.token)
-                    Logger.console.info("Fortify secret written to fortify.ini")
-                    Logger.console.info("Attempting to rerun 'fortify list'")
-                    fortify_client.list_versions()
+        fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
+                                       token_manager=fortify_token_manager(fortify_config, fortify_user,
+                                                                           fortify_password))
+        if application:
+            reauth = fortify_client.list_application_versions(application, output=output)
         else:
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url, fortify_username=fortify_user,
-                                           fortify_password=fortify_password)
-            fortify_config.write_token(fortify_client.token)
-            fortify_config.write_username(fortify_user)
-            fortify_config.write_password(fortify_password)
-            Logger.console.info("Fortify secret written to fortify.ini")
-            if application:
-                fortify_client.list_application_versions(application)
-            else:
-                fortify_client.list_versions()
-    except (AttributeError, UnboundLocalError) as e:
+            reauth = fortify_client.list_versions(output=output)
+        if reauth == -1:
+            Logger.console.critical("Unable to authenticate with Fortify, unable to complete command 'fortify list'")
+    except (AttributeError, UnboundLocalError, ValueError) as e:
         Logger.console.critical("Unable to complete command 'fortify list'")
 
 
@@ -456,54 +512,63 @@ def fortify_list(config, fortify_user, fortify_password, application):
               required=False,
               help="Name of the Fortify application that version belongs to. If this option is not provided, application_name from fortify.ini will be used.")
 @click.option('--version',
-              required=True,
+              required=False,
               help="Name of Fortify application version which you would like to upload a scan to.")
 @click.option('--scan_name',
               required=False,
               help="If the name of the file is different than --version, use this option to to specify the name of the file (without the extension)")
+@click.option('--glob', 'glob_pattern',
+              required=False,
+              help="Upload every scan file matching this glob (or in this directory), each to the version named after the file")
+@click.option('--manifest',
+              required=False,
+              help="JSON file listing the scan files to upload and their application and version")
+@click.option('--workers',
+              required=False,
+              type=int,
+              default=4,
+              help="Number of files uploaded at once with --glob or --manifest")
 @pass_config
-def upload(config, fortify_user, fortify_password, application, version, scan_name):
+def upload(config, fortify_user, fortify_password, application, version, scan_name, glob_pattern, manifest, workers):
+    from webbreaker.fortifyclient import FortifyClient, find_scan_files
+    from webbreaker.fortifyconfig import FortifyConfig
+
     fortify_config = FortifyConfig()
     # Fortify only accepts fpr scan files
     x = 'fpr'
     if application:
         fortify_config.application_name = application
+    if glob_pattern or manifest:
+        try:
+            uploads = find_scan_files(glob_pattern=glob_pattern, manifest=manifest,
+                                      application=fortify_config.application_name, extension=x)
+            if not uploads:
+                Logger.console.error("No scan files found to upload")
+                return
+            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
+                                           project_template=fortify_config.project_template,
+                                           application_name=fortify_config.application_name, extension=x,
+                                           token_manager=fortify_token_manager(fortify_config, fortify_user,
+                                                                               fortify_password))
+            results = fortify_client.upload_scans(uploads, workers=workers)
+            if any(error for file_path, application, version, error in results):
+                sys.exit(1)
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            Logger.console.critical("Unable to complete command 'fortify upload': {}".format(e))
+            sys.exit(1)
+        return
+    if not version:
+        Logger.console.error("Please provide --version, --glob or --manifest")
+        return
     if not scan_name:
         scan_name = version
     try:
-        if not fortify_user or not fortify_password:
-            Logger.console.info("No Fortify username or password provided. Checking fortify.ini for secret")
-            if fortify_config.token or fortify_config.has_auth_creds():
-                Logger.console.info("Fortify secret found in fortify.ini")
-                fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                               project_template=fortify_config.project_template,
-                                               application_name=fortify_config.application_name,
-                                               token=fortify_config.token, scan_name=version, extension=x,
-                                               fortify_username=fortify_config.username, fortify_password=fortify_config.password)
-                fortify_config.write_token(fortify_client.token)
-            else:
-                Logger.console.info("Fortify secret not found in fortify.ini")
-                fortify_user, fortify_password = fortify_prompt()
-                fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                               project_template=fortify_config.project_template,
-                                               application_name=fortify_config.application_name,
-                                               fortify_username=fortify_user,
-                                               fortify_password=fortify_password, scan_name=version,
-                                               extension=x)
-                fortify_config.write_token(fortify_client.token)
-                fortify_config.write_username(fortify_user)
-                fortify_config.write_password(fortify_password)
-                Logger.console.info("Fortify secret written to fortify.ini")
-        else:
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                           project_template=fortify_config.project_template,
-                                           application_name=fortify_config.application_name,
-                                           fortify_username=fortify_user,
-                                           fortify_password=fortify_password, scan_name=version, extension=x)
-            fortify_config.write_token(fortify_client.token)
-            fortify_config.write_username(fortify_user)
-            fortify_config.write_password(fortify_password)
-            Logger.console.info("Fortify secret written to fortify.ini")
+        fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
+                                       project_template=fortify_config.project_template,
+                                       application_name=fortify_config.application_name,
+                                       scan_name=version, extension=x,
+                                       token_manager=fortify_token_manager(fortify_config, fortify_user,
+                                                                           fortify_password))
 
         reauth = fortify_client.upload_scan(file_name=scan_name)
 
@@ -511,30 +576,8 @@ def upload(config, fortify_user, fortify_password, application, version, scan_na
             # The given application doesn't exist
             Logger.console.critical("Fortify Application {} does not exist. Unable to upload scan.".format(application))
 
-        if reauth == -1 and fortify_config.token:
-            Logger.console.info("Fortify secret invalid...reauthorizing")
-            if fortify_config.has_auth_creds():
-                fortify_user = fortify_config.username
-                fortify_password = fortify_config.password
-            else:
-                fortify_user, fortify_password = fortify_prompt()
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                           project_template=fortify_config.project_template,
-                                           application_name=fortify_config.application_name,
-                                           fortify_username=fortify_user,
-                                           fortify_password=fortify_password, scan_name=version, extension=x)
-            fortify_config.write_username(fortify_user)
-            fortify_config.write_password(fortify_password)
-            fortify_config.write_token(fortify_client.token)
-
-            Logger.console.info("Fortify secret written to fortify.ini")
-            Logger.console.info("Attempting to re-run 'fortify upload'")
-            app_error = fortify_client.upload_scan(file_name=scan_name)
-
-            if app_error == -2:
-                # The given application doesn't exist
-                Logger.console.critical(
-                    "Fortify Application {} does not exist. Unable to upload scan.".format(application))
+        if reauth == -1:
+            Logger.console.critical("Unable to authenticate with Fortify, unable to complete command 'fortify upload'")
     except:
         Logger.console.critical("Unable to complete command 'fortify upload'")
 
@@ -553,77 +596,30 @@ def upload(config, fortify_user, fortify_password, application, version, scan_na
               help="Jenkins BuildID")
 @pass_config
 def fortify_scan(config, fortify_user, fortify_password, application, version, build_id):
+    from webbreaker.fortifyclient import FortifyClient
+    from webbreaker.fortifyconfig import FortifyConfig
+    from webbreaker.gitclient import write_agent_info
+
     fortify_config = FortifyConfig()
     if application:
         fortify_config.application_name = application
 
-    if not fortify_user or not fortify_password:
-        Logger.console.info("No Fortify username or password provided. Checking fortify.ini for secret")
-        if fortify_config.token or fortify_config.has_auth_creds():
-            Logger.console.info("Fortify secret found in fortify.ini")
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                           project_template=fortify_config.project_template,
-                                           application_name=fortify_config.application_name,
-                                           token=fortify_config.token, scan_name=version,
-                                           fortify_username=fortify_config.username, fortify_password=fortify_config.password)
-            fortify_config.write_token(fortify_client.token)
-        else:
-            Logger.console.info("Fortify secret not found in fortify.ini")
-            fortify_user, fortify_password = fortify_prompt()
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                           project_template=fortify_config.project_template,
-                                           application_name=fortify_config.application_name,
-                                           fortify_username=fortify_user,
-                                           fortify_password=fortify_password, scan_name=version)
-            fortify_config.write_token(fortify_client.token)
-            fortify_config.write_username(fortify_user)
-            fortify_config.write_password(fortify_password)
-            Logger.console.info("Fortify secret written to fortify.ini")
-
-        pv_url = fortify_client.build_pv_url()
-
-        if pv_url == -1:
-            Logger.console.info("Fortify secret invalid...reauthorizing")
-            if fortify_config.has_auth_creds():
-                fortify_user = fortify_config.username
-                fortify_password = fortify_config.password
-            else:
-                fortify_user, fortify_password = fortify_prompt()
-            fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
-                                           project_template=fortify_config.project_template,
-                                           application_name=fortify_config.application_name,
-                                           fortify_username=fortify_user,
-                                           fortify_password=fortify_password, scan_name=version)
-            fortify_config.write_username(fortify_user)
-            fortify_config.write_password(fortify_password)
-            fortify_config.write_token(fortify_client.token)
-            Logger.console.info("Fortify secret written to fortify.ini")
-            Logger.console.info("Attempting to rerun 'fortify scan'")
-            pv_url = fortify_client.build_pv_url()
-
-        if pv_url and pv_url != -1:
-            write_agent_info('fortify_pv_url', pv_url)
-            write_agent_info('fortify_build_id', build_id)
-        else:
-            Logger.console.critical("Unable to complete command 'fortify scan'")
-
-    else:
+    try:
         fortify_client = FortifyClient(fortify_url=fortify_config.ssc_url,
                                        project_template=fortify_config.project_template,
                                        application_name=fortify_config.application_name,
-                                       fortify_username=fortify_user,
-                                       fortify_password=fortify_password, scan_name=version)
-        fortify_config.write_token(fortify_client.token)
-        fortify_config.write_username(fortify_user)
-        fortify_config.write_password(fortify_password)
-        Logger.console.info("Fortify secret written to fortify.ini")
+                                       scan_name=version,
+                                       token_manager=fortify_token_manager(fortify_config, fortify_user,
+                                                                           fortify_password))
         pv_url = fortify_client.build_pv_url()
-        if pv_url and pv_url != -1:
-            write_agent_info('fortify_pv_url', pv_url)
-            write_agent_info('fortify_build_id', build_id)
-        else:
-            Logger.console.critical("Unable to complete command 'fortify scan'")
+    except ValueError:
+        pv_url = None
 
+    if pv_url and pv_url != -1:
+        write_agent_info('fortify_pv_url', pv_url)
+        write_agent_info('fortify_build_id', build_id)
+    else:
+        Logger.console.critical("Unable to complete command 'fortify scan'")
 
 
 @cli.group(help="""TODO""")
@@ -641,6 +637,8 @@ def admin(config):
               help="The url of the Git repo from which to find contributors. Ex: --url https://github.com/target/webbreaker")
 @pass_config
 def notifier(config, email, git_url):
+    from webbreaker.gitclient import GitClient, write_agent_info
+
     try:
         if not email:
             Logger.console.info("'webbreaker admin notifier' currently only supports email notifications. Please use the '--email' flag")
@@ -672,6 +670,8 @@ def notifier(config, email, git_url):
               help="Optional flag which instruct WebBreaker to create an agent")
 @pass_config
 def agent(config, start):
+    from webbreaker.gitclient import read_agent_info
+
     if not start:
         try:
             agent_data = read_agent_info()
@@ -685,12 +685,18 @@ def agent(config, start):
             sys.stdout.write(str("Unable to complete read agent configurations!\n"))
             return
     else:
+        from webbreaker.webbreakeragent.agent import AgentClient
         try:
             # If any data is missing, verifier will output and exit
             # verifier = AgentVerifier('webbreaker/etc/agent.json')
-            pid = subprocess.Popen(['python', 'webbreaker/webbreakeragent/agent.py', 'webbreaker/etc/agent.json'])
-            sys.stdout.write(str("Creating agent...."))
-        except TypeError as e:
+            # One agent daemon watches every build, hand it this one instead of starting an agent per build
+            AgentClient.submit(read_agent_info())
+            if not AgentClient.is_running():
+                AgentClient.start_daemon()
+                sys.stdout.write(str("Creating agent...."))
+            else:
+                sys.stdout.write(str("Submitted build to running agent...."))
+        except (TypeError, IOError, OSError) as e:
             Logger.app.error("Unable to complete command 'admin agent': {}".format(e))
         return
 
@@ -1,16 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import csv
+import glob
+import json
 import os
 import socket
+import sys
+import threading
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 from webbreaker.webbreakerhelper import WebBreakerHelper
 from webbreaker.webbreakerlogger import Logger
-from fortifyapi.fortify import FortifyApi
+from webbreaker.fortifytokenmanager import FortifyTokenManager
+from webbreaker.fortifyversionindex import FortifyVersionIndex
+from webbreaker.sscapi.ssc import SscApi
+
+# Files uploaded at once by FortifyClient.upload_scans
+UPLOAD_WORKERS = 4
 
 
 class FortifyClient(object):
     def __init__(self, fortify_url, project_template=None, application_name=None, fortify_username=None,
-                 fortify_password=None, scan_name=None, extension=None, token=None):
+                 fortify_password=None, scan_name=None, extension=None, token=None, token_manager=None,
+                 version_index=None):
         self.ssc_server = fortify_url
         self.project_template = project_template
         self.application_name = application_name
@@ -19,36 +34,36 @@ class FortifyClient(object):
         self.fortify_version = scan_name
         self.extension = extension
         self.runenv = WebBreakerHelper.check_run_env()
-        self.token = token
-        if not token:
-            self.token = self.get_token()
+        # Every method shares one token manager and, through SscApi, one pooled HTTP session. Expiring tokens
+        # are refreshed ahead of time and a rejected token is replaced and the request retried once.
+        self.token_manager = token_manager
+        if not self.token_manager:
+            self.token_manager = FortifyTokenManager(fortify_url, token=token, username=fortify_username,
+                                                     password=fortify_password)
+        self.api = SscApi(self.ssc_server, token_manager=self.token_manager, verify_ssl=False)
+        self.version_index = version_index if version_index else FortifyVersionIndex()
+        self.recover_lock = threading.Lock()
 
         if not self.token:
             Logger.console.error("Unable to obtain a Fortify API token. Invalid Credentials")
             raise ValueError("Unable to obtain a Fortify API token.")
 
-    def get_token(self):
-        try:
-            api = FortifyApi(self.ssc_server, username=self.user, password=self.password, verify_ssl=False)
-            response = api.get_token()
-            if response.success:
-                token = response.data['data']['token']
-                return token
-            else:
-                Logger.app.critical(response.message)
-        except Exception as e:
-            if hasattr(e, 'message'):
-                Logger.app.critical("Exception while getting Fortify token: {0}".format(e.message))
+    @property
+    def token(self):
+        return self.token_manager.get_token()
 
-        return None
+    def get_token(self):
+        return self.token_manager.refresh_token()
 
     def __get_project_id__(self, project_name):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
-        response = api.get_projects()
-        if response.success:
-            for project in response.data['data']:
-                if project['name'] == project_name:
-                    return project['id']
+        project_id = self.version_index.get_project_id(self.ssc_server, project_name)
+        if project_id:
+            return project_id
+        api = self.api
+        response = api.find_project(project_name)
+        if response.success and response.data:
+            self.version_index.record_project(self.ssc_server, project_name, response.data['id'])
+            return response.data['id']
         return None
 
     def __project_version_description__(self):
@@ -62,7 +77,7 @@ class FortifyClient(object):
         Create, add required attributes to, and commit a new project version
         :return: The new project_version_id if successful. Otherwise, None.
         """
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+        api = self.api
         try:
             response = api.create_project_version(project_name=self.application_name,
                                                   project_id=self.__get_project_id__(self.application_name),
@@ -74,33 +89,22 @@ class FortifyClient(object):
                 raise ValueError("Failed to create a new project version")
 
             project_version_id = response.data['data']['id']
-
-            # At Target, only one attribute is required
-            response = api.add_project_version_attribute(project_version_id=project_version_id,
-                                                         attribute_definition_id=self.__get_attribute_definition_id__(
-                                                             search_expression='name:"CI Number"'),
-                                                         value='New WebBreaker Application',
-                                                         values=[])
-            if not response.success:
-                raise ValueError("Failed to create required project version attribute")
-
-            response = api.commit_project_version(project_version_id=project_version_id)
-            if not response.success:
-                raise ValueError("Failed to commit new project version")
-                #Logger.app.debug("Created new project version id {0}".format(project_version_id))
+            self.__commit_project_version__(project_version_id)
+            self.version_index.record_version(self.ssc_server, self.application_name, self.fortify_version,
+                                              project_version_id)
             return project_version_id
 
         except Exception as e:
-            Logger.app.critical("Exception trying to create project version. {0}".format(e.message))
+            Logger.app.critical("Exception trying to create project version. {0}".format(e))
 
         return None
 
     def __create_new_project_version__(self):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+        api = self.api
 
         try:
-            # It's kinda dumb for this api call to require both project name and id?
-            response = api.create_new_project_version(project_name=self.application_name,
+            # Without a project id, SSC creates the project along with the version
+            response = api.create_project_version(project_name=self.application_name,
                                                   project_template=self.project_template,
                                                   version_name=self.fortify_version,
                                                   description=self.__project_version_description__())
@@ -110,30 +114,53 @@ class FortifyClient(object):
 
             project_version_id = response.data['data']['id']
             project_id = response.data['data']['project']['id']
-
-            # At Target, only one attribute is required
-            response = api.add_project_version_attribute(project_version_id=project_version_id,
-                                                         attribute_definition_id=self.__get_attribute_definition_id__(
-                                                             search_expression='name:"CI Number"'),
-                                                         value='New WebBreaker Application',
-                                                         values=[])
-            if not response.success:
-                raise ValueError("Failed to create required project version attribute")
-
-            response = api.commit_project_version(project_version_id=project_version_id)
-            if not response.success:
-                raise ValueError("Failed to commit new project version")
-                # Logger.app.debug("Created new project version id {0}".format(project_version_id))
+            self.__commit_project_version__(project_version_id)
+            self.version_index.record_version(self.ssc_server, self.application_name, self.fortify_version,
+                                              project_version_id, project_id=project_id)
         except (AttributeError, UnboundLocalError) as e:
             Logger.app.critical("Exception trying to create project version. {0}".format(e))
 
         return project_version_id
 
+    def __commit_project_version__(self, project_version_id):
+        """
+        Add the required attributes to a new project version and commit it, in one /bulk request when SSC
+        supports it
+        """
+        api = self.api
+        # At Target, only one attribute is required
+        attributes = [{'attributeDefinitionId': self.__get_attribute_definition_id__(
+                           search_expression='name:"CI Number"'),
+                       'values': [],
+                       'value': 'New WebBreaker Application'}]
+        response = api.bulk_commit_project_version(project_version_id=project_version_id, attributes=attributes)
+        if response.success:
+            return
+        Logger.app.debug("Bulk commit of project version {0} failed, committing step by step. {1}".format(
+            project_version_id, response.message))
+
+        response = api.add_project_version_attribute(project_version_id=project_version_id,
+                                                     attribute_definition_id=attributes[0]['attributeDefinitionId'],
+                                                     value=attributes[0]['value'],
+                                                     values=attributes[0]['values'])
+        if not response.success:
+            raise ValueError("Failed to create required project version attribute")
+
+        response = api.commit_project_version(project_version_id=project_version_id)
+        if not response.success:
+            raise ValueError("Failed to commit new project version")
+
     def __get_attribute_definition_id__(self, search_expression):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+        attribute_definition_id = self.version_index.get_attribute_definition_id(self.ssc_server, search_expression)
+        if attribute_definition_id:
+            return attribute_definition_id
+        api = self.api
         response = api.get_attribute_definition(search_expression=search_expression)
         if response.success:
-            return response.data['data'][0]['id']
+            attribute_definition_id = response.data['data'][0]['id']
+            self.version_index.record_attribute_definition(self.ssc_server, search_expression,
+                                                           attribute_definition_id)
+            return attribute_definition_id
         else:
             return None
 
@@ -144,37 +171,45 @@ class FortifyClient(object):
         If none of the above succeeds, log the reason(s) and return None
         :return:
         """
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+        version_id = self.version_index.get_version_id(self.ssc_server, self.application_name, self.fortify_version)
+        if version_id:
+            Logger.app.debug("Found indexed project version {0}".format(version_id))
+            return version_id
+
+        api = self.api
         try:
-            response = api.get_project_versions()  # api should support a search expression here. alas...
-            if response.success:
-                for project_version in response.data['data']:
-                    if project_version['project']['name'] == self.application_name:
-                        if project_version['name'] == self.fortify_version:
-                            # we have a matching project version
-                            Logger.app.debug("Found existing project version {0}".format(project_version['id']))
-                            return project_version['id']
-                # Didn't find a matching project version, verify that our project exists
-                for project_version in response.data['data']:
-                        if project_version['project']['name'] == self.application_name:
-                            # Our project exsits, so create a new version
-                            return self.__create_project_version__()
+            response = api.find_project(self.application_name)
+            if response.success and response.data:
+                project_id = response.data['id']
+                self.version_index.record_project(self.ssc_server, self.application_name, project_id)
+                response = api.find_project_version(project_id, self.fortify_version)
+                if response.success and response.data:
+                    # we have a matching project version
+                    Logger.app.debug("Found existing project version {0}".format(response.data['id']))
+                    self.version_index.record_version(self.ssc_server, self.application_name, self.fortify_version,
+                                                      response.data['id'], project_id=project_id)
+                    return response.data['id']
+                if response.success:
+                    # Our project exists, so create a new version
+                    return self.__create_project_version__()
+            elif response.success:
                 # Let upload_scan know that our project doesn't exist
                 return -2
-            elif "401" in response.message:
+            if "401" in response.message:
                 # Avoid printing error for invalid token. Return -1 to reauth
                 return -1
             else:
                 Logger.app.critical("Failed to get project version. {0}".format(response.message))
         except Exception as e:
-            Logger.app.critical("Exception trying to get project version. {0}".format(e.message))
+            Logger.app.critical("Exception trying to get project version. {0}".format(e))
 
         return None
 
-    def upload_scan(self, file_name):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+    def __resolve_project_version__(self):
+        """
+        :return: The project_version_id, creating the version (and its project) if needed. -1 on an auth error.
+        """
         project_version_id = self.__get_project_version__()
-        # If our project doesn't exist, exit upload_scan
         if project_version_id == -1:
             return -1
         project_id = self.__get_project_id__(self.application_name)
@@ -182,9 +217,26 @@ class FortifyClient(object):
             project_version_id = self.__create_new_project_version__()
         if not project_version_id:
             project_version_id = self.__create_project_version__()
+        return project_version_id
+
+    def upload_scan(self, file_name):
+        api = self.api
+        project_version_id = self.__resolve_project_version__()
+        # If our project doesn't exist, exit upload_scan
+        if project_version_id == -1:
+            return -1
         if project_version_id:
-            response = api.upload_artifact_scan(file_path=('{0}.{1}'.format(file_name, self.extension)),
-                                                project_version_id=project_version_id)
+            response = api.upload_artifact_stream(file_path=('{0}.{1}'.format(file_name, self.extension)),
+                                                  project_version_id=project_version_id,
+                                                  progress=self.__upload_progress__(file_name))
+            if not response.success:
+                # The indexed version may have been deleted on SSC, then look it up (or create it) again
+                project_version_id = self.__recover_project_version__(self.application_name, self.fortify_version,
+                                                                      project_version_id)
+                if project_version_id:
+                    response = api.upload_artifact_stream(file_path=('{0}.{1}'.format(file_name, self.extension)),
+                                                          project_version_id=project_version_id,
+                                                          progress=self.__upload_progress__(file_name))
 
         if response.success:
             Logger.console.info(
@@ -198,8 +250,135 @@ class FortifyClient(object):
             Logger.app.error("Error uploading {0}.{1}!!!".format(self.fortify_version, self.extension))
         return response
 
+    def upload_scans(self, uploads, workers=UPLOAD_WORKERS):
+        """
+        Upload many scan files with one token: every version is resolved (or created) up front, then the files are
+        uploaded by a bounded pool of threads sharing this client's HTTP session.
+        :param uploads: List of (file path, application, version)
+        :return: List of (file path, application, version, error), error is None for uploaded files
+        """
+        version_ids = self.__resolve_project_versions__(set((application, version)
+                                                            for file_path, application, version in uploads))
+        pending = queue.Queue()
+        for index in range(len(uploads)):
+            pending.put(index)
+        results = [None] * len(uploads)
+
+        def upload_worker():
+            while True:
+                try:
+                    index = pending.get_nowait()
+                except queue.Empty:
+                    return
+                file_path, application, version = uploads[index]
+                version_id = version_ids.get((application, version))
+                if not version_id or version_id == -1:
+                    error = "Unable to find or create version {0} of {1}".format(version, application)
+                else:
+                    try:
+                        response = self.api.upload_artifact_stream(file_path=file_path, project_version_id=version_id)
+                        if not response.success:
+                            version_id = self.__recover_project_version__(application, version, version_id)
+                            if version_id:
+                                response = self.api.upload_artifact_stream(file_path=file_path,
+                                                                           project_version_id=version_id)
+                        error = None if response.success else response.message
+                    except (IOError, OSError) as e:
+                        error = str(e)
+                results[index] = (file_path, application, version, error)
+                if error:
+                    Logger.app.error("Error uploading {0} to {1} {2}: {3}".format(file_path, application, version,
+                                                                                 error))
+                else:
+                    Logger.app.debug("Uploaded {0} to {1} {2}".format(file_path, application, version))
+
+        threads = [threading.Thread(target=upload_worker) for _ in range(max(1, min(workers, len(uploads))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        Logger.console.info("{0:40} {1:20} {2:20} {3}".format('File', 'Application', 'Version', 'Result'))
+        Logger.console.info("{0:40} {1:20} {2:20} {3}".format('-' * 40, '-' * 20, '-' * 20, '-' * 20))
+        for file_path, application, version, error in results:
+            Logger.console.info("{0:40} {1:20} {2:20} {3}".format(os.path.basename(file_path), application, version,
+                                                                  error if error else 'Uploaded'))
+        return results
+
+    def __resolve_project_versions__(self, versions):
+        """
+        :param versions: Set of (application, version)
+        :return: dict of (application, version) to project_version_id. Each application's versions are listed at
+                 most once, versions that do not exist yet are created.
+        """
+        version_ids = {}
+        listed = set()
+        for application, version in sorted(versions):
+            version_id = self.version_index.get_version_id(self.ssc_server, application, version)
+            if not version_id and application not in listed:
+                listed.add(application)
+                self.__index_application_versions__(application)
+                version_id = self.version_index.get_version_id(self.ssc_server, application, version)
+            if not version_id:
+                version_id = self.__for_version__(application, version).__resolve_project_version__()
+            version_ids[(application, version)] = version_id
+        return version_ids
+
+    def __recover_project_version__(self, application, version, stale_id):
+        """
+        After a failed upload to stale_id, check SSC still has that version. resultFileUpload.html reports a deleted
+        version as a failure code in a 200 response, so the upload response alone can't tell.
+        :return: project_version_id of the version resolved again if stale_id was deleted, otherwise None
+        """
+        with self.recover_lock:
+            version_id = self.version_index.get_version_id(self.ssc_server, application, version)
+            if version_id and version_id != stale_id:
+                # recovered by another upload already
+                return version_id
+            response = self.api.get_project_version(stale_id)
+            if response.success or response.response_code != 404:
+                return None
+            Logger.app.info("Project version {0} of {1} {2} no longer exists, resolving it again".format(
+                stale_id, application, version))
+            self.version_index.forget_version(self.ssc_server, application, version)
+            version_id = self.__for_version__(application, version).__resolve_project_version__()
+            return version_id if version_id and version_id != -1 else None
+
+    def __index_application_versions__(self, application):
+        project_id = self.__get_project_id__(application)
+        if not project_id:
+            return
+        for response in self.api.iter_project_versions(project_id):
+            if not response.success:
+                Logger.app.error("Unable to list versions of {0}: {1}".format(application, response.message))
+                return
+            for version in response.data['data']:
+                self.version_index.record_version(self.ssc_server, application, version['name'], version['id'],
+                                                  project_id=project_id)
+
+    def __for_version__(self, application, version):
+        """
+        :return: FortifyClient for another application version, sharing this client's token and index
+        """
+        return FortifyClient(self.ssc_server, project_template=self.project_template, application_name=application,
+                             scan_name=version, extension=self.extension, token_manager=self.token_manager,
+                             version_index=self.version_index)
+
+    def __upload_progress__(self, file_name):
+        """
+        :return: Upload progress callback that reports every 10 percent of file_name sent
+        """
+        reported = [0]
+
+        def progress(sent, total):
+            percent = sent * 100 // total if total else 100
+            if percent >= reported[0] + 10 or (percent == 100 and reported[0] < 100):
+                reported[0] = percent
+                Logger.console.info("Uploading {0}.{1}: {2}%".format(file_name, self.extension, percent))
+        return progress
+
     def list_projects(self):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
+        api = self.api
         response = api.get_projects()
         if response.success:
             Logger.console.info("{0:^5} {1:30}".format('ID', 'Name'))
@@ -208,29 +387,43 @@ class FortifyClient(object):
                 Logger.console.info("{0:^5} {1:30}".format(proj['id'], proj['name']))
         return None
 
-    def list_versions(self):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
-        response = api.get_project_versions()
-        if response.success:
-            Logger.console.info("{0:^5} {1:30}".format('ID', 'Name'))
-            Logger.console.info("{0:5} {1:30}".format('-'*5, '-'*30))
-            for version in response.data['data']:
-                Logger.console.info("{0:^5} {1:30}".format(version['id'], version['name']))
-        elif not response.success and "401" in response.message:
-            return response.response_code
-        return None
+    def list_versions(self, output='table'):
+        return self.__write_versions__(self.api.iter_project_versions(params={'fields': 'id,name'}), output)
 
-    def list_application_versions(self, application):
-        api = FortifyApi(self.ssc_server, token=self.token, verify_ssl=False)
-        response = api.get_project_versions()
-        if response.success:
-            Logger.console.info("{0:^5} {1:30}".format('ID', 'Name'))
-            Logger.console.info("{0:5} {1:30}".format('-' * 5, '-' * 30))
-            for version  in response.data['data']:
-                if version['project']['name'] == application:
-                    Logger.console.info("{0:^5} {1:30}".format(version['id'], version['name']))
-        elif not response.success and "401" in response.message:
-            return response.response_code
+    def list_application_versions(self, application, output='table'):
+        project_id = self.version_index.get_project_id(self.ssc_server, application)
+        if not project_id:
+            response = self.api.find_project(application)
+            if not response.success:
+                if "401" in response.message:
+                    return response.response_code
+                Logger.console.error("Unable to list versions of {0}. {1}".format(application, response.message))
+                return None
+            if not response.data:
+                Logger.console.error("Fortify Application {0} does not exist.".format(application))
+                return None
+            project_id = response.data['id']
+            self.version_index.record_project(self.ssc_server, application, project_id)
+        return self.__write_versions__(self.api.iter_project_versions(project_id, params={'fields': 'id,name'}),
+                                       output)
+
+    def __write_versions__(self, pages, output):
+        """
+        Write versions as each page arrives, so the first rows show up before the listing is complete.
+        :param output: table (through the console logger), json or csv (to stdout)
+        """
+        writer = VersionWriter(output)
+        try:
+            for response in pages:
+                if not response.success:
+                    if "401" in response.message:
+                        return response.response_code
+                    Logger.console.error("Unable to list versions. {0}".format(response.message))
+                    return None
+                for version in response.data['data']:
+                    writer.write(version['id'], version['name'])
+        finally:
+            writer.close()
         return None
 
     def build_pv_url(self):
@@ -257,3 +450,63 @@ class FortifyClient(object):
             Logger.app.critical("Exception trying to build Project Version URL. {0}".format(e))
             
         return self.ssc_server + '/ssc/html/ssc/index.jsp#!/version/' + str(version_id)
+
+
+class VersionWriter(object):
+    """
+    Streams (id, name) rows of fortify list as a table, a JSON array or CSV.
+    """
+    def __init__(self, output='table', stream=None):
+        self.output = output
+        self.stream = stream if stream else sys.stdout
+        self.rows = 0
+        if self.output == 'csv':
+            self.csv_writer = csv.writer(self.stream)
+            self.csv_writer.writerow(['id', 'name'])
+        elif self.output == 'json':
+            self.stream.write('[')
+        else:
+            Logger.console.info("{0:^5} {1:30}".format('ID', 'Name'))
+            Logger.console.info("{0:5} {1:30}".format('-' * 5, '-' * 30))
+
+    def write(self, version_id, name):
+        if self.output == 'csv':
+            self.csv_writer.writerow([version_id, name])
+        elif self.output == 'json':
+            self.stream.write('{0}\n  {1}'.format(',' if self.rows else '',
+                                                 json.dumps({'id': version_id, 'name': name})))
+        else:
+            Logger.console.info("{0:^5} {1:30}".format(version_id, name))
+        self.rows += 1
+        if self.output != 'table' and self.rows % 100 == 0:
+            self.stream.flush()
+
+    def close(self):
+        if self.output == 'json':
+            self.stream.write('\n]\n' if self.rows else ']\n')
+        if self.output != 'table':
+            self.stream.flush()
+
+
+def find_scan_files(glob_pattern=None, manifest=None, application=None, extension='fpr'):
+    """
+    Collect scan files for FortifyClient.upload_scans.
+    :param glob_pattern: Glob (or directory) of scan files, each uploaded to the version named after the file
+    :param manifest: JSON file listing {"file": ..., "application": ..., "version": ...} entries. application and
+                     version default to the application argument and the file name.
+    :return: List of (file path, application, version)
+    """
+    uploads = []
+    if glob_pattern:
+        if os.path.isdir(glob_pattern):
+            glob_pattern = os.path.join(glob_pattern, '*.{0}'.format(extension))
+        for file_path in sorted(glob.glob(glob_pattern)):
+            uploads.append((file_path, application, os.path.splitext(os.path.basename(file_path))[0]))
+    if manifest:
+        with open(manifest, 'r') as manifest_file:
+            entries = json.load(manifest_file)
+        for entry in entries:
+            file_path = os.path.join(os.path.dirname(os.path.abspath(manifest)), entry['file'])
+            uploads.append((file_path, entry.get('application', application),
+                            entry.get('version', os.path.splitext(os.path.basename(file_path))[0])))
+    return uploads
@@ -13,48 +13,59 @@ from subprocess import CalledProcessError
 from cryptography.fernet import Fernet
 
 from webbreaker.secretclient import SecretClient
-
-# TODO: Test on Python2
-try:  # Python 2
-    config = configparser.SafeConfigParser()
-except NameError:  # Python 3
-    config = configparser.ConfigParser()
+from webbreaker.webbreakerconfigloader import load_config
 
 
 class FortifyConfig(object):
     def __init__(self):
         config_file = os.path.abspath(os.path.join('webbreaker', 'etc', 'fortify.ini'))
         try:
-            config.read(config_file)
+            config = load_config('fortify')
             self.application_name = config.get("fortify", "application_name")
             self.project_template = config.get("fortify", "project_template")
             self.ssc_url = config.get("fortify", "ssc_url")
 
-            secret_client = SecretClient()
-            self.token = secret_client.get('fortify', 'fortify', 'fortify_token')
-            self.username = secret_client.get('fortify', 'fortify', 'fortify_username')
-            self.password = secret_client.get('fortify', 'fortify', 'fortify_password')
+            self.secret_client = SecretClient()
+            self.token = self.secret_client.get('fortify', 'fortify', 'fortify_token')
+            self.username = self.secret_client.get('fortify', 'fortify', 'fortify_username')
+            self.password = self.secret_client.get('fortify', 'fortify', 'fortify_password')
+            self.token_expiry = None
+            if config.has_option('fortify', 'fortify_token_expiry'):
+                self.token_expiry = self.secret_client.get('fortify', 'fortify', 'fortify_token_expiry')
 
         except (configparser.NoOptionError, CalledProcessError) as noe:
             Logger.console.error("{} has incorrect or missing values {}".format(config_file, noe))
         except configparser.Error as e:
             Logger.app.error("Error reading {} {}".format(config_file, e))
 
-    def write_token(self, token):
-        self.token = token
+    def write_credentials(self, token=None, username=None, password=None, token_expiry=None):
+        """
+        Store any of the provided secrets that changed in fortify.ini with a single write
+        """
+        secrets = {}
+        if token and token != self.token:
+            self.token = token
+            secrets['fortify_token'] = token
+        if token_expiry and token_expiry != self.token_expiry:
+            self.token_expiry = token_expiry
+            secrets['fortify_token_expiry'] = token_expiry
+        if username and username != self.username:
+            self.username = username
+            secrets['fortify_username'] = username
+        if password and password != self.password:
+            self.password = password
+            secrets['fortify_password'] = password
+        if secrets:
+            self.secret_client.set_many('fortify', 'fortify', secrets)
 
-        secret_client = SecretClient()
-        secret_client.set('fortify', 'fortify', 'fortify_token', token)
+    def write_token(self, token):
+        self.write_credentials(token=token)
 
     def write_username(self, username):
-        self.username = username
-        secret_client = SecretClient()
-        secret_client.set('fortify', 'fortify', 'fortify_username', username)
+        self.write_credentials(username=username)
 
     def write_password(self, password):
-        self.password = password
-        secret_client = SecretClient()
-        secret_client.set('fortify', 'fortify', 'fortify_password', password)
+        self.write_credentials(password=password)
 
     def has_auth_creds(self):
         if self.username and self.password:
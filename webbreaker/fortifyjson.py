@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 
+import copy
 import json
 import os
 import socket
@@ -157,69 +158,58 @@ json_ssc_filetoken = {
 
 
 def formatted_application_version_payload(project_name, version_name, issuetemplateid, runenv):
-    global json_application_version
+    json_payload = copy.deepcopy(json_application_version)
 
-    json_application_version['project']['issueTemplateId'] = issuetemplateid
-    json_application_version['project']['name'] = project_name
+    json_payload['project']['issueTemplateId'] = issuetemplateid
+    json_payload['project']['name'] = project_name
 
-    json_application_version['issueTemplateId'] = issuetemplateid
-    json_application_version['name'] = version_name
+    json_payload['issueTemplateId'] = issuetemplateid
+    json_payload['name'] = version_name
 
     if runenv == "jenkins":
-        json_application_version['description'] = "WebInspect scan from WebBreaker " + os.getenv('JOB_URL', "jenkins server")
+        json_payload['description'] = "WebInspect scan from WebBreaker " + os.getenv('JOB_URL', "jenkins server")
     else:
-        json_application_version['description'] = "WebBreaker scan from WebBreaker host " + socket.getfqdn()
-
-    return json_application_version
-
-
-def formatted_bulk_ssc_payload(attributes_uri, responsibilities_uri, action_uri, application_version_uri):
-    global json_ssc_bulk_attributes
-
-    str_json_bulk_attributes = json.dumps(json_ssc_bulk_attributes)
-    str_json_bulk_attributes = str_json_bulk_attributes.replace('"true"', "true")
-    str_json_bulk_attributes = str_json_bulk_attributes.replace('"false"', "false")
-    str_json_bulk_attributes = str_json_bulk_attributes.replace('"null"', "null")
-    json_ssc_bulk_attributes = json.loads(str_json_bulk_attributes)
-
-    json_ssc_bulk_attributes['uri'] = attributes_uri
-
-    global json_ssc_bulk_responsibilities
-    str_json_ssc_bulk_responsibilities = json.dumps(json_ssc_bulk_responsibilities)
-    str_json_ssc_bulk_responsibilities = str_json_ssc_bulk_responsibilities.replace('"true"', "true")
-    str_json_ssc_bulk_responsibilities = str_json_ssc_bulk_responsibilities.replace('"false"', "false")
-    str_json_ssc_bulk_responsibilities = str_json_ssc_bulk_responsibilities.replace('"null"', "null")
-    json_ssc_bulk_responsibilities = json.loads(str_json_ssc_bulk_responsibilities)
-
-    json_ssc_bulk_responsibilities['uri'] = responsibilities_uri
-
+        json_payload['description'] = "WebBreaker scan from WebBreaker host " + socket.getfqdn()
+
+    return json_payload
+
+
+def formatted_bulk_ssc_payload(attributes_uri, responsibilities_uri, action_uri, application_version_uri,
+                               attributes=None):
+    """
+    Build a fresh /bulk payload from the templates above, every call returns a new payload.
+    Requests whose uri is None are left out.
+    :param attributes: postData for the attributes request, defaults to json_ssc_bulk_attributes
+    """
+    json_payload = copy.deepcopy(json_ssc_bulk)
+
+    if attributes_uri:
+        json_bulk_attributes = __bulk_request__(json_ssc_bulk_attributes, attributes_uri)
+        if attributes is not None:
+            json_bulk_attributes['postData'] = copy.deepcopy(attributes)
+        json_payload['requests'].append(json_bulk_attributes)
+    if responsibilities_uri:
+        json_payload['requests'].append(__bulk_request__(json_ssc_bulk_responsibilities, responsibilities_uri))
     #added for v16.10
-    global json_ssc_bulk_action
-    str_json_ssc_bulk_action = json.dumps(json_ssc_bulk_action)
-    str_json_ssc_bulk_action = str_json_ssc_bulk_action.replace('"true"', "true")
-    str_json_ssc_bulk_action = str_json_ssc_bulk_action.replace('"false"', "false")
-    str_json_ssc_bulk_action = str_json_ssc_bulk_action.replace('"null"', "null")
-    json_ssc_bulk_action = json.loads(str_json_ssc_bulk_action)
-
-    json_ssc_bulk_action['uri'] = action_uri
+    if action_uri:
+        json_payload['requests'].append(__bulk_request__(json_ssc_bulk_action, action_uri))
+    if application_version_uri:
+        json_payload['requests'].append(__bulk_request__(json_ssc_bulk_appversion, application_version_uri))
 
-    global json_ssc_bulk_appversion
-    str_json_ssc_bulk_appversion = json.dumps(json_ssc_bulk_appversion)
-    str_json_ssc_bulk_appversion = str_json_ssc_bulk_appversion.replace('"true"', "true")
-    str_json_ssc_bulk_appversion = str_json_ssc_bulk_appversion.replace('"false"', "false")
-    str_json_ssc_bulk_appversion = str_json_ssc_bulk_appversion.replace('"null"', "null")
-    json_ssc_bulk_appversion = json.loads(str_json_ssc_bulk_appversion)
+    return json_payload
 
-    json_ssc_bulk_appversion['uri'] = application_version_uri
 
-    global json_ssc_bulk
-    json_ssc_bulk['requests'].append(json_ssc_bulk_attributes)
-    json_ssc_bulk['requests'].append(json_ssc_bulk_responsibilities)
-    json_ssc_bulk['requests'].append(json_ssc_bulk_action)
-    json_ssc_bulk['requests'].append(json_ssc_bulk_appversion)
+def __bulk_request__(template, uri):
+    # The templates spell JSON literals as strings, turn them into real true/false/null
+    str_json_request = json.dumps(template)
+    str_json_request = str_json_request.replace('"true"', "true")
+    str_json_request = str_json_request.replace('"false"', "false")
+    str_json_request = str_json_request.replace('"null"', "null")
+    json_request = json.loads(str_json_request)
 
-    return json_ssc_bulk
+    json_request['uri'] = uri
+    return json_request
 
 
 def formatted_filetoken_payload():
-    return json_ssc_filetoken
+    return copy.deepcopy(json_ssc_filetoken)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import calendar
+import re
+import threading
+import time
+from webbreaker.webbreakerlogger import Logger
+from webbreaker.sscapi.ssc import SscApi
+
+# Tokens are refreshed this many seconds before SSC expires them
+TOKEN_REFRESH_AHEAD = 300
+
+
+class FortifyTokenManager(object):
+    """
+    Owns the Fortify SSC token for a command: hands it to SscApi, refreshes it ahead of its expiry and, when SSC
+    rejects it, replaces it once using the stored credentials (or by prompting for them).
+    """
+    def __init__(self, ssc_url, token=None, token_expiry=None, username=None, password=None, prompt=None,
+                 on_refresh=None, verify_ssl=False):
+        """
+        :param token_expiry: Epoch seconds the token expires at, None if unknown
+        :param prompt: Callable returning (username, password) when no usable credentials are stored
+        :param on_refresh: Callable receiving token, token_expiry, username and password keyword arguments
+                           whenever a new token is obtained, e.g. to persist them
+        """
+        self.ssc_url = ssc_url
+        self.token = token
+        self.token_expiry = float(token_expiry) if token_expiry else None
+        self.username = username
+        self.password = password
+        self.prompt = prompt
+        self.on_refresh = on_refresh
+        self.verify_ssl = verify_ssl
+        self.lock = threading.RLock()
+
+    def get_token(self):
+        """
+        :return: A token that is not known to be expired or about to expire, or None if none can be obtained
+        """
+        with self.lock:
+            if not self.token:
+                return self.__request_token__()
+            if self.__expiring__() and self.username and self.password:
+                Logger.app.debug("Fortify token expires soon, refreshing")
+                return self.__request_token__() or self.token
+            return self.token
+
+    def refresh_token(self, expired_token=None):
+        """
+        Replace a token SSC rejected. If another caller already replaced expired_token, its replacement is
+        returned without requesting a new one.
+        """
+        with self.lock:
+            if expired_token and self.token and self.token != expired_token:
+                return self.token
+            Logger.console.info("Fortify secret invalid...reauthorizing")
+            self.token = None
+            self.token_expiry = None
+            return self.__request_token__()
+
+    def __expiring__(self):
+        return self.token_expiry is not None and time.time() > self.token_expiry - TOKEN_REFRESH_AHEAD
+
+    def __request_token__(self):
+        prompted = False
+        if not self.username or not self.password:
+            if not self.prompt:
+                return None
+            self.username, self.password = self.prompt()
+            prompted = True
+
+        api = SscApi(self.ssc_url, verify_ssl=self.verify_ssl)
+        response = api.get_token(self.username, self.password)
+        if not response.success and response.response_code == 401 and not prompted and self.prompt:
+            # stored credentials are no longer valid
+            Logger.console.info("Fortify credentials in fortify.ini are invalid")
+            self.username, self.password = self.prompt()
+            response = api.get_token(self.username, self.password)
+
+        if not response.success:
+            Logger.app.critical("Unable to obtain a Fortify API token: {}".format(response.message))
+            return None
+
+        try:
+            self.token = response.data['data']['token']
+            self.token_expiry = self.__parse_terminal_date__(response.data['data'].get('terminalDate'))
+        except (KeyError, TypeError) as e:
+            Logger.app.critical("Unexpected Fortify token response: {}".format(e))
+            return None
+
+        if self.on_refresh:
+            self.on_refresh(token=self.token, token_expiry=str(self.token_expiry) if self.token_expiry else None,
+                            username=self.username, password=self.password)
+        return self.token
+
+    @staticmethod
+    def __parse_terminal_date__(terminal_date):
+        """
+        :param terminal_date: SSC timestamp such as 2017-11-23T18:54:50.000+0000
+        :return: Epoch seconds, or None if terminal_date is missing or not understood
+        """
+        if not terminal_date:
+            return None
+        match = re.match(r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?$', terminal_date)
+        if not match:
+            return None
+        expiry = calendar.timegm(time.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S'))
+        offset = match.group(2)
+        if offset and offset != 'Z':
+            sign = -1 if offset[0] == '-' else 1
+            digits = offset[1:].replace(':', '')
+            expiry -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+        return expiry
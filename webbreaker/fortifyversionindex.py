@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+try:
+    import ConfigParser as configparser
+except ImportError: #Python3
+    import configparser
+import os
+import sqlite3
+import threading
+import time
+from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakerconfigloader import load_config
+
+VERSION_INDEX_DB = os.path.abspath(os.path.join('webbreaker', 'etc', 'fortify_versions.db'))
+# Seconds an indexed id is trusted before SSC is asked again, override with index_ttl in fortify.ini
+INDEX_TTL = 86400
+
+
+class FortifyVersionIndex(object):
+    """
+    Local SQLite index of Fortify SSC ids: application name to project id, (application, version) to project
+    version id and attribute name to attribute definition id, per SSC server. Entries expire after a TTL and
+    are written through whenever WebBreaker looks up or creates a project version, so repeat uploads to a known
+    version need no lookups at all.
+    """
+    def __init__(self, db_path=VERSION_INDEX_DB, ttl=None):
+        self.db_path = db_path
+        self.ttl = ttl if ttl is not None else self.__configured_ttl__()
+        self.lock = threading.Lock()
+        self.connection = None
+        try:
+            self.connection = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS projects ("
+                                        "server TEXT, "
+                                        "project_name TEXT, "
+                                        "project_id INTEGER, "
+                                        "updated REAL, "
+                                        "PRIMARY KEY (server, project_name))")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS versions ("
+                                        "server TEXT, "
+                                        "project_name TEXT, "
+                                        "version_name TEXT, "
+                                        "version_id INTEGER, "
+                                        "updated REAL, "
+                                        "PRIMARY KEY (server, project_name, version_name))")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS attributes ("
+                                        "server TEXT, "
+                                        "search_expression TEXT, "
+                                        "attribute_definition_id INTEGER, "
+                                        "updated REAL, "
+                                        "PRIMARY KEY (server, search_expression))")
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to open the Fortify version index {0}: {1}".format(self.db_path, e))
+            self.connection = None
+
+    def get_project_id(self, server, project_name):
+        return self.__lookup__("SELECT project_id FROM projects WHERE server = ? AND project_name = ? "
+                               "AND updated > ?", (server, project_name))
+
+    def get_version_id(self, server, project_name, version_name):
+        return self.__lookup__("SELECT version_id FROM versions WHERE server = ? AND project_name = ? "
+                               "AND version_name = ? AND updated > ?", (server, project_name, version_name))
+
+    def get_attribute_definition_id(self, server, search_expression):
+        return self.__lookup__("SELECT attribute_definition_id FROM attributes WHERE server = ? "
+                               "AND search_expression = ? AND updated > ?", (server, search_expression))
+
+    def record_project(self, server, project_name, project_id):
+        self.__execute__([("INSERT OR REPLACE INTO projects (server, project_name, project_id, updated) "
+                           "VALUES (?, ?, ?, ?)", (server, project_name, project_id, time.time()))])
+
+    def record_version(self, server, project_name, version_name, version_id, project_id=None):
+        """
+        Add (or replace) a project version, and its project when project_id is known.
+        """
+        now = time.time()
+        statements = [("INSERT OR REPLACE INTO versions (server, project_name, version_name, version_id, updated) "
+                       "VALUES (?, ?, ?, ?, ?)", (server, project_name, version_name, version_id, now))]
+        if project_id:
+            statements.append(("INSERT OR REPLACE INTO projects (server, project_name, project_id, updated) "
+                               "VALUES (?, ?, ?, ?)", (server, project_name, project_id, now)))
+        self.__execute__(statements)
+
+    def record_attribute_definition(self, server, search_expression, attribute_definition_id):
+        self.__execute__([("INSERT OR REPLACE INTO attributes (server, search_expression, attribute_definition_id, "
+                           "updated) VALUES (?, ?, ?, ?)",
+                           (server, search_expression, attribute_definition_id, time.time()))])
+
+    def forget_version(self, server, project_name, version_name):
+        """
+        Drop a project version SSC no longer knows about, along with its project.
+        """
+        self.__execute__([("DELETE FROM versions WHERE server = ? AND project_name = ? AND version_name = ?",
+                           (server, project_name, version_name)),
+                          ("DELETE FROM projects WHERE server = ? AND project_name = ?", (server, project_name))])
+
+    def __lookup__(self, statement, parameters):
+        if not self.connection:
+            return None
+        try:
+            with self.lock:
+                row = self.connection.execute(statement, parameters + (time.time() - self.ttl,)).fetchone()
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to read the Fortify version index {0}: {1}".format(self.db_path, e))
+            return None
+        if row:
+            return row[0]
+        return None
+
+    def __execute__(self, statements):
+        if not self.connection or not statements:
+            return
+        try:
+            with self.lock:
+                with self.connection:
+                    for statement, parameters in statements:
+                        self.connection.execute(statement, parameters)
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to update the Fortify version index {0}: {1}".format(self.db_path, e))
+
+    @staticmethod
+    def __configured_ttl__():
+        try:
+            config = load_config('fortify')
+            if config.has_option('fortify', 'index_ttl') and config.get('fortify', 'index_ttl'):
+                return int(config.get('fortify', 'index_ttl'))
+        except (configparser.Error, ValueError) as e:
+            Logger.app.error("Invalid index_ttl in fortify.ini, using {0}: {1}".format(INDEX_TTL, e))
+        return INDEX_TTL
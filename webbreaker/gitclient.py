@@ -3,6 +3,7 @@
 
 from webbreaker.gitapi.git import GitApi
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakerconfigloader import load_config
 import requests
 import requests.exceptions
 import requests.packages.urllib3
@@ -12,10 +13,10 @@ try:
     import ConfigParser as configparser
 except ImportError: #Python3
     import configparser
-try:  # Python 2
-    config = configparser.SafeConfigParser()
-except NameError:  # Python 3
-    config = configparser.ConfigParser()
+
+# Header carrying the intake_token of webbreaker.ini to the agent intake server
+TOKEN_HEADER = 'X-WebBreaker-Token'
+
 
 class GitClient(object):
     def __init__(self, host):
@@ -61,9 +62,7 @@ class GitClient(object):
             return None
 
     def get_token(self):
-        config_file = os.path.abspath(os.path.join('webbreaker', 'etc', 'webbreaker.ini'))
-        config.read(config_file)
-        return config.get("git", "token")
+        return load_config('webbreaker').get("git", "token")
 
 
 def write_agent_info(name, value):
@@ -114,6 +113,7 @@ def read_agent_info():
 class UploadJSON(object):
     def __init__(self, log_file):
         self.git_emails = None
+        self.git_url = None
         self.fortify_pv_url = None
         self.fortify_build_id = None
         if os.path.isfile(log_file):
@@ -127,6 +127,7 @@ class UploadJSON(object):
             if self.__verify__(data) == -1:
                 exit(1)
             self.git_emails = data['git_emails']
+            self.git_url = data.get('git_url')
             self.fortify_pv_url = data['fortify_pv_url']
             self.fortify_build_id = data['fortify_build_id']
         else:
@@ -147,7 +148,10 @@ class UploadJSON(object):
         return 1
 
 class AgentVerifier(object):
-    def __init__(self, log_file):
+    def __init__(self, log_file=None):
+        # Without a log_file the verifier only checks data handed to __verify__, e.g. by the agent intake server
+        if log_file is None:
+            return
         if os.path.isfile(log_file):
             with open(log_file, 'r') as json_file:
                 try:
@@ -187,9 +191,13 @@ class GitUploader(object):
 
 
     def read_ini(self):
-        config_file = os.path.abspath(os.path.join('webbreaker', 'etc', 'webbreaker.ini'))
-        config.read(config_file)
-        return config.get("agent", "webbreaker_agent")
+        return load_config('webbreaker').get("agent", "webbreaker_agent")
+
+    def read_token(self):
+        config = load_config('webbreaker')
+        if config.has_option("agent", "intake_token"):
+            return config.get("agent", "intake_token")
+        return None
 
 
     def upload(self):
@@ -197,7 +205,12 @@ class GitUploader(object):
         data['fortify_pv_url'] = self.upload_log.fortify_pv_url
         data['fortify_build_id'] = self.upload_log.fortify_build_id
         data['git_emails'] = self.upload_log.git_emails
-        response = requests.put(self.agent_url, data=data)
+        data['git_url'] = self.upload_log.git_url
+        headers = {}
+        token = self.read_token()
+        if token:
+            headers[TOKEN_HEADER] = token
+        response = requests.put(self.agent_url, data=data, headers=headers)
         return response.status_code
 
 
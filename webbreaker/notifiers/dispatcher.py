@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import threading
+import time
+try:
+    import queue
+except ImportError:  # Python2
+    import Queue as queue
+from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakermetrics import NOTIFICATIONS
+
+# Attempts made per notification, RETRY_DELAY seconds apart and doubling after each failure
+SEND_ATTEMPTS = 3
+RETRY_DELAY = 2
+# Notifications waiting to be sent, further ones are dropped rather than blocking the caller
+QUEUE_SIZE = 1000
+# Seconds shutdown waits for queued notifications before giving up on them
+FLUSH_TIMEOUT = 10
+# Seconds without work after which the dispatcher releases its connection
+IDLE_TIMEOUT = 60
+
+
+class Delivery(object):
+    """
+    Outcome of one queued notification.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.sent = False
+
+    def wait(self, timeout=None):
+        """
+        :return: True once the notification has been sent, False if it failed or timeout passed first
+        """
+        self.done.wait(timeout)
+        return self.sent
+
+
+class NotificationDispatcher(object):
+    """
+    Sends notifications from one background thread so callers never wait on a mail relay. Failed sends are
+    retried up to attempts times. The release callable, e.g. closing a pooled connection, runs on the dispatcher
+    thread once it has been idle for idle_timeout seconds and when it stops.
+    """
+    def __init__(self, name, release=None, attempts=SEND_ATTEMPTS, retry_delay=RETRY_DELAY, queue_size=QUEUE_SIZE,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.name = name
+        self.release = release
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.condition = threading.Condition()
+        self.pending = 0
+        self.closed = False
+        self.thread = None
+        atexit.register(self.close)
+
+    def submit(self, send, *args):
+        """
+        Queue send(*args) without waiting for it.
+        :return: Delivery of the notification, None if it was dropped
+        """
+        delivery = Delivery()
+        with self.condition:
+            if self.closed:
+                return None
+            try:
+                self.queue.put_nowait((send, args, delivery))
+            except queue.Full:
+                Logger.app.error("{} queue is full, dropping notification".format(self.name))
+                NOTIFICATIONS.inc(notifier=self.name, result='dropped')
+                return None
+            self.pending += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run__, name=self.name)
+                self.thread.daemon = True
+                self.thread.start()
+        return delivery
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Wait up to timeout seconds for every queued notification to be sent or given up on.
+        :return: True if nothing is left to send
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    Logger.app.error("{} gave up on {} unsent notifications".format(self.name, self.pending))
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """
+        Flush and stop the dispatcher, further notifications are refused.
+        """
+        with self.condition:
+            if self.closed:
+                return True
+            self.closed = True
+        deadline = time.time() + timeout
+        flushed = self.flush(timeout)
+        if self.thread is not None:
+            try:
+                self.queue.put_nowait((None, (), None))
+            except queue.Full:
+                # the daemon thread is left to die with the process
+                return flushed
+            self.thread.join(max(0, deadline - time.time()))
+        return flushed
+
+    def __run__(self):
+        while True:
+            try:
+                send, args, delivery = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self.__release__()
+                continue
+            if send is None:
+                self.__release__()
+                return
+            delivery.sent = self.__send__(send, args)
+            delivery.done.set()
+            with self.condition:
+                self.pending -= 1
+                self.condition.notify_all()
+
+    def __send__(self, send, args):
+        for attempt in range(self.attempts):
+            if attempt:
+                NOTIFICATIONS.inc(notifier=self.name, result='retried')
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                send(*args)
+                NOTIFICATIONS.inc(notifier=self.name, result='sent')
+                return True
+            except Exception as e:
+                Logger.app.error("{} failed to send a notification (attempt {} of {}): {}".format(
+                    self.name, attempt + 1, self.attempts, e))
+        NOTIFICATIONS.inc(notifier=self.name, result='failed')
+        Logger.console.error("Error sending notification, see log: {}!".format(Logger.app_logfile))
+        return False
+
+    def __release__(self):
+        if self.release:
+            try:
+                self.release()
+            except Exception as e:
+                Logger.app.debug("{} failed to release its connection: {}".format(self.name, e))
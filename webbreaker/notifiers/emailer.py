@@ -12,24 +12,57 @@ import smtplib
 import os
 from webbreaker.notifiers.notifier import Notifier
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakerconfigloader import load_config
+from webbreaker.notifiers.dispatcher import NotificationDispatcher, FLUSH_TIMEOUT
 from subprocess import CalledProcessError
 try:
     import ConfigParser as configparser
 except ImportError: #Python3
     import configparser
 
-try:  # Python 2
-    config = configparser.SafeConfigParser()
-except NameError:  # Python 3
-    config = configparser.ConfigParser()
+# Seconds an SMTP connect or command may take, so a hung relay can't stall the dispatcher forever
+SMTP_TIMEOUT = 60
+
+
+class SmtpConnection(object):
+    """
+    SMTP connection opened on the first message and reused for the next ones, reopened once if the relay has
+    dropped it in between.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def sendmail(self, from_address, to_address, message):
+        if self.server is None:
+            self.server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            self.server.sendmail(from_address, to_address, message)
+        except smtplib.SMTPServerDisconnected:
+            self.server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            self.server.sendmail(from_address, to_address, message)
+
+    def close(self):
+        server, self.server = self.server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, IOError, OSError):
+                server.close()
+
 
 class EmailNotifier(Notifier):
     def __init__(self, emailer_settings=None):
         if emailer_settings:
             self.emailer_settings = emailer_settings
+            self.connection = SmtpConnection(self.emailer_settings['smtp_host'], self.emailer_settings['smtp_port'])
         else:
             self.is_agent = True
             self.__read_agent_settings__()
+            self.connection = SmtpConnection(getattr(self, 'smtp_host', None), getattr(self, 'smtp_port', None))
+        # Messages are sent in the background over one SMTP connection, so scans never wait on the relay
+        self.dispatcher = NotificationDispatcher('email', release=self.connection.close)
         Notifier.__init__(self, "EmailNotifier")
 
     def notify(self, event):
@@ -47,15 +80,15 @@ class EmailNotifier(Notifier):
                                                                           ["<li>{0}</li>".format(t) for t in event['targets']]))
             msg.attach(MIMEText(html, 'html'))
 
-            mail_server = smtplib.SMTP(self.emailer_settings['smtp_host'], self.emailer_settings['smtp_port'])
-            mail_server.sendmail(msg['From'], msg['To'], msg.as_string())
-
-            mail_server.quit()
+            self.dispatcher.submit(self.__send__, msg)
         except (Exception, AttributeError) as e:  # we don't want email failure to stop us, just log that it happened
-            Logger.app.error("Error sending email. {}".format(e.message))
+            Logger.app.error("Error sending email. {}".format(e))
             Logger.console.error("Error sending email, see log: {}!".format(Logger.app_logfile))
 
     def cloudscan_notify(self, recipient, subject, git_url, ssc_url, state, scan_id, scan_name):
+        """
+        :return: Delivery of the queued message, None if it could not be queued
+        """
         try:
             msg = MIMEMultipart()
             msg['From'] = self.from_address
@@ -65,19 +98,24 @@ class EmailNotifier(Notifier):
             html = str(self.email_template).format(git_url, ssc_url, scan_name, scan_id, state, self.chatroom)
             msg.attach(MIMEText(html, 'html'))
 
-            mail_server = smtplib.SMTP(self.smtp_host, self.smtp_port)
-            mail_server.sendmail(msg['From'], msg['To'], msg.as_string())
-
-            mail_server.quit()
+            return self.dispatcher.submit(self.__send__, msg)
         except (Exception, AttributeError) as e:  # we don't want email failure to stop us, just log that it happened
-            Logger.app.error("Error sending email. {}".format(e.message))
+            Logger.app.error("Error sending email. {}".format(e))
             Logger.console.error("Error sending email, see log: {}!".format(Logger.app_logfile))
+            return None
+
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        return self.dispatcher.flush(timeout)
 
+    def __send__(self, msg):
+        # Runs on the dispatcher thread, the only user of self.connection
+        self.connection.sendmail(msg['From'], msg['To'], msg.as_string())
 
     def __read_agent_settings__(self):
         settings_file = os.path.abspath(os.path.join('webbreaker', 'etc', 'email.ini'))
         try:
-            config.read(settings_file)
+            config = load_config('email')
             self.smtp_host = config.get("agent_emailer", "smtp_host")
             self.smtp_port = config.get("agent_emailer", "smtp_port")
             self.from_address = config.get("agent_emailer", "from_address")
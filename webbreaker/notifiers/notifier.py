@@ -16,3 +16,11 @@ class Notifier(object):
         :param event: The event for which to create a notification
         """
         pass
+
+    def flush(self, timeout=None):
+        """
+        Wait for notifications still being sent in the background.
+        :param timeout: Seconds to wait at most
+        :return: True if nothing is left to send
+        """
+        return True
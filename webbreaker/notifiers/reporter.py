@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.notifiers.dispatcher import FLUSH_TIMEOUT
 
 
 class Reporter(object):
@@ -15,3 +17,13 @@ class Reporter(object):
                 notifier.notify(event)
         except (Exception, AttributeError):
             Logger.console.error("Error sending email, see log: {}!".format(Logger.app_logfile))
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Wait up to timeout seconds in all for the notifiers to send what report has queued.
+        """
+        deadline = time.time() + timeout
+        flushed = True
+        for notifier in self.notifiers:
+            flushed = notifier.flush(max(0, deadline - time.time())) and flushed
+        return flushed
@@ -9,11 +9,18 @@ from subprocess import CalledProcessError
 import os
 import sys
 import re
+import tempfile
+import threading
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakerconfigloader import load_config, invalidate_config
 from cryptography.fernet import Fernet
 
-
-
+# The Fernet key is read and the cipher built once per process, and every decrypted value is cached by its
+# ciphertext, so repeated gets never touch .webbreaker or re-run decryption.
+_lock = threading.Lock()
+_fernet_key = None
+_cipher = None
+_decrypted = {}
 
 
 class SecretClient(object):
@@ -30,9 +37,8 @@ class SecretClient(object):
 
     def get(self, ini, section, key):
         config_file = self.__get_ini_file__(ini)
-        self.config.read(config_file)
         try:
-            encryp_value = self.config.get(section, key)
+            encryp_value = load_config(ini).get(section, key)
         except configparser.NoSectionError:
             return None
         except (configparser.NoOptionError, CalledProcessError) as noe:
@@ -53,13 +59,39 @@ class SecretClient(object):
 
 
     def set(self, ini, section, key, value):
-        encryp_value = self.__encrypt__(value)
+        return self.set_many(ini, section, {key: value})
+
+
+    def set_many(self, ini, section, values):
+        """
+        Encrypt and write several secrets to one ini file with a single atomic file replace.
+        :param values: dict of option name to plaintext value
+        """
         config_file = self.__get_ini_file__(ini)
         try:
             self.config.read(config_file)
-            self.config.set(section, key, "e$Fernet$" + encryp_value.decode())
-            with open(config_file, 'w') as new_config:
-                self.config.write(new_config)
+            for key, value in values.items():
+                encryp_value = "e$Fernet$" + self.__encrypt__(value).decode()
+                self.config.set(section, key, encryp_value)
+                with _lock:
+                    _decrypted[encryp_value] = value
+
+            # mkstemp creates the file readable by its owner only, before any secret is written to it
+            fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(config_file) + '.',
+                                             dir=os.path.dirname(os.path.abspath(config_file)))
+            try:
+                with os.fdopen(fd, 'w') as new_config:
+                    self.config.write(new_config)
+            except (IOError, OSError):
+                os.remove(temp_file)
+                raise
+            if os.path.isfile(config_file):
+                os.chmod(temp_file, os.stat(config_file).st_mode & 0o777)
+            if hasattr(os, 'replace'):
+                os.replace(temp_file, config_file)
+            else:  # Python 2
+                os.rename(temp_file, config_file)
+            invalidate_config()
 
         except (configparser.NoOptionError, CalledProcessError) as noe:
             Logger.app.error("{} has incorrect or missing values, see log file {}".format(config_file, Logger.app_logfile))
@@ -68,13 +100,16 @@ class SecretClient(object):
             Logger.console.error("Error reading {}, see log file: {}".format(config_file, Logger.app_logfile))
             Logger.app.error("Error reading {} {}".format(config_file, e))
             sys.exit(1)
+        except (IOError, OSError) as e:
+            Logger.console.error("Error writing {}, see log file: {}".format(config_file, Logger.app_logfile))
+            Logger.app.error("Error writing {} {}".format(config_file, e))
+            sys.exit(1)
         return True
 
 
     def __encrypt__(self, value):
         try:
-            cipher = Fernet(self.fernet_key)
-            encryp_value = cipher.encrypt(value.encode())
+            encryp_value = self.__cipher__().encrypt(value.encode())
             return encryp_value
         except ValueError as e:
             Logger.console.error("Error encrypting...exiting without completeing command."
@@ -85,12 +120,15 @@ class SecretClient(object):
 
 
     def __decrypt__(self, encryp_value):
+        with _lock:
+            if encryp_value in _decrypted:
+                return _decrypted[encryp_value]
+
         encryption_version = re.search('e\$(.*)\$.*', encryp_value).group(1)
         if encryption_version == 'Fernet':
-            encryp_value = encryp_value.split(encryption_version + "$", 1)[1]
+            token = encryp_value.split(encryption_version + "$", 1)[1]
             try:
-                cipher = Fernet(self.fernet_key)
-                decryp_value = cipher.decrypt(encryp_value.encode()).decode()
+                decryp_value = self.__cipher__().decrypt(token.encode()).decode()
             except ValueError as e:
                 Logger.console.error(
                     "Error decrypting the Fortify token.  Exiting now, see log {}!".format(Logger.app_logfile))
@@ -100,16 +138,28 @@ class SecretClient(object):
             Logger.console.error("Error decrypting.  Unsupported encryption version")
             sys.exit(1)
 
+        with _lock:
+            _decrypted[encryp_value] = decryp_value
         return decryp_value
 
 
+    def __cipher__(self):
+        global _cipher
+        with _lock:
+            if _cipher is None:
+                _cipher = Fernet(self.fernet_key)
+            return _cipher
+
 
     def __read_fernet_secret__(self):
+        global _fernet_key
+        if _fernet_key:
+            return _fernet_key
         try:
             with open(".webbreaker", 'r') as secret_file:
-                fernet_key = secret_file.readline().strip()
+                _fernet_key = secret_file.readline().strip()
             Logger.app.debug("Fernet key found. Attempting decryption of Fortify token")
-            return fernet_key
+            return _fernet_key
         except IOError:
             Logger.console.error("Error retrieving Fernet key, file does not exist. Please run 'python "
                                  "setup.py secret' to reset")
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import ntpath
+import os
+import re
+import threading
+import time
+import uuid
+import requests
+import requests.exceptions
+import requests.packages.urllib3
+from webbreaker.fortifyjson import formatted_filetoken_payload, formatted_bulk_ssc_payload
+from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakermetrics import record_api_request
+
+# Entries requested per page when paging through SSC listings
+PAGE_SIZE = 200
+# Bytes read from disk per chunk while streaming an upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Attempts made for a streamed upload that fails with a connection error, timeout or 5xx response
+UPLOAD_ATTEMPTS = 4
+# resultFileUpload.html answers with this code once SSC has accepted the file for processing
+UPLOAD_ACCEPTED = '-10001'
+
+# One pooled HTTP session per process, shared by every SscApi instance
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update({'Accept': 'application/json'})
+        return _session
+
+
+class SscApi(object):
+    """
+    Thin client for the Fortify Software Security Center (SSC) REST API. Requests carry a token from the
+    provided token manager and go through one pooled HTTP session; a 401 response is retried once with a
+    refreshed token.
+    """
+    def __init__(self, host, token_manager=None, verify_ssl=True, timeout=60):
+        self.host = host.rstrip('/')
+        self.token_manager = token_manager
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+
+        if not self.verify_ssl:
+            requests.packages.urllib3.disable_warnings()
+
+    def get_token(self, username, password, description='WebBreaker'):
+        """
+        :return: A new UnifiedLoginToken for username, the token and its terminalDate are under data['data']
+        """
+        return self._request('POST', '/ssc/api/v1/tokens', json={'type': 'UnifiedLoginToken',
+                                                                 'description': description},
+                             auth=(username, password))
+
+    def get_projects(self):
+        return self._request('GET', '/ssc/api/v1/projects', params={'limit': '-1'})
+
+    def get_project_version(self, project_version_id):
+        return self._request('GET', '/ssc/api/v1/projectVersions/{}'.format(project_version_id))
+
+    def get_project_versions(self):
+        return self._request('GET', '/ssc/api/v1/projectVersions', params={'limit': '-1'})
+
+    def iter_project_versions(self, project_id=None, params=None, page_size=PAGE_SIZE):
+        """
+        Page through the versions of project_id, or of every project, yielding one SscResponse per page.
+        """
+        if project_id:
+            url = '/ssc/api/v1/projects/{}/versions'.format(project_id)
+        else:
+            url = '/ssc/api/v1/projectVersions'
+        return self.iter_pages(url, params=params, page_size=page_size)
+
+    def iter_pages(self, url, params=None, page_size=PAGE_SIZE):
+        """
+        Page through an SSC listing, yielding one SscResponse per page. Stops after the last page or the first
+        failed response.
+        """
+        start = 0
+        while True:
+            response = self._request('GET', url, params=dict(params or {}, start=start, limit=page_size))
+            yield response
+            if not response.success:
+                return
+            entries = response.data.get('data') or []
+            start += len(entries)
+            if not entries or start >= response.data.get('count', 0):
+                return
+
+    def find_project(self, project_name, page_size=PAGE_SIZE):
+        """
+        :return: SscResponse whose data is the project named project_name, or None if there is no such project
+        """
+        return self.__find_by_name__('/ssc/api/v1/projects', project_name, page_size)
+
+    def find_project_version(self, project_id, version_name, page_size=PAGE_SIZE):
+        """
+        :return: SscResponse whose data is the version of project_id named version_name, or None if there is none
+        """
+        return self.__find_by_name__('/ssc/api/v1/projects/{}/versions'.format(project_id), version_name, page_size)
+
+    def get_attribute_definition(self, search_expression):
+        return self._request('GET', '/ssc/api/v1/attributeDefinitions', params={'q': search_expression})
+
+    def create_project_version(self, project_name, project_template, version_name, description, project_id=None):
+        """
+        Create an uncommitted version. Without project_id a new project (application) is created along with it.
+        """
+        project = {'name': project_name, 'description': description, 'issueTemplateId': project_template}
+        if project_id:
+            project['id'] = project_id
+        return self._request('POST', '/ssc/api/v1/projectVersions', json={'name': version_name,
+                                                                          'description': description,
+                                                                          'active': True,
+                                                                          'committed': False,
+                                                                          'project': project,
+                                                                          'issueTemplateId': project_template})
+
+    def add_project_version_attribute(self, project_version_id, attribute_definition_id, value=None, values=None):
+        return self._request('POST', '/ssc/api/v1/projectVersions/{}/attributes'.format(project_version_id),
+                             json={'attributeDefinitionId': attribute_definition_id,
+                                   'values': values if values else [],
+                                   'value': value})
+
+    def commit_project_version(self, project_version_id):
+        return self._request('PUT', '/ssc/api/v1/projectVersions/{}'.format(project_version_id),
+                             json={'committed': True})
+
+    def bulk_commit_project_version(self, project_version_id, attributes):
+        """
+        Set the attributes of an uncommitted version and commit it with one /bulk request.
+        :param attributes: List of {'attributeDefinitionId': ..., 'values': [...], 'value': ...}
+        :return: SscResponse, unsuccessful if any of the bulked requests failed
+        """
+        version_uri = '{}/ssc/api/v1/projectVersions/{}'.format(self.host, project_version_id)
+        payload = formatted_bulk_ssc_payload(attributes_uri=version_uri + '/attributes', responsibilities_uri=None,
+                                             action_uri=None, application_version_uri=version_uri,
+                                             attributes=attributes)
+        response = self._request('POST', '/ssc/api/v1/bulk', json=payload)
+        if not response.success:
+            return response
+        for result in response.data.get('data') or []:
+            for bulked in result.get('responses') or []:
+                code = (bulked.get('body') or {}).get('responseCode', 200)
+                if code >= 300:
+                    return SscResponse(success=False, response_code=code, data=response.data,
+                                       message="{} {} failed with {}".format(result['request'].get('httpVerb'),
+                                                                             result['request'].get('uri'), code))
+        return response
+
+    def upload_artifact_scan(self, file_path, project_version_id):
+        with open(file_path, 'rb') as scan_file:
+            return self._request('POST', '/ssc/api/v1/projectVersions/{}/artifacts'.format(project_version_id),
+                                 files={'file': (ntpath.basename(file_path), scan_file)})
+
+    def get_cloudscan_jobs(self, params=None):
+        return self._request('GET', '/ssc/api/v1/cloudjobs', params=params)
+
+    def iter_cloudscan_jobs(self, params=None, page_size=PAGE_SIZE):
+        """
+        Page through the cloudscan jobs, yielding one SscResponse per page.
+        """
+        return self.iter_pages('/ssc/api/v1/cloudjobs', params=params, page_size=page_size)
+
+    def get_cloudscan_job_status(self, job_token):
+        return self._request('GET', '/ssc/api/v1/cloudjobs/{}'.format(job_token))
+
+    def get_file_token(self):
+        return self._request('POST', '/ssc/api/v1/fileTokens', json=formatted_filetoken_payload())
+
+    def upload_artifact_stream(self, file_path, project_version_id, progress=None, attempts=UPLOAD_ATTEMPTS):
+        """
+        Stream file_path to SSC in UPLOAD_CHUNK_SIZE chunks through the file token upload flow, so memory use does
+        not depend on the size of the file. Transient failures are retried with backoff, each attempt under a
+        fresh file token.
+        :param progress: Callable receiving (bytes sent, total bytes) as the upload proceeds
+        """
+        url = self.host + '/ssc/upload/resultFileUpload.html'
+        response = None
+        for attempt in range(attempts):
+            if attempt:
+                delay = 2 ** attempt
+                Logger.app.info("Upload of {} failed ({}), retrying in {} seconds".format(file_path, response.message,
+                                                                                         delay))
+                time.sleep(delay)
+
+            response = self.get_file_token()
+            if not response.success:
+                return response
+            file_token = response.data['data']['token']
+
+            with StreamingMultipart(file_path, fields={'entityId': str(project_version_id)},
+                                    progress=progress) as body:
+                started = time.time()
+                try:
+                    upload = get_session().post(url, params={'mat': file_token}, data=body,
+                                                headers={'Content-Type': body.content_type,
+                                                         'Accept': 'application/xml'},
+                                                verify=self.verify_ssl, timeout=self.timeout)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    record_api_request('ssc', time.time() - started, None)
+                    response = SscResponse(success=False, message='{}'.format(e))
+                    continue
+                except requests.exceptions.RequestException as e:
+                    record_api_request('ssc', time.time() - started, None)
+                    return SscResponse(success=False,
+                                       message='There was an error while handling the request. {}'.format(e))
+                record_api_request('ssc', time.time() - started, upload.status_code)
+
+            response = self.__upload_response__(upload)
+            if response.success or upload.status_code < 500:
+                return response
+        return response
+
+    @staticmethod
+    def __upload_response__(upload):
+        """
+        resultFileUpload.html answers with a small XML document such as
+        <Response><code>-10001</code><msg>Background submission succeeded.</msg></Response>
+        """
+        code = re.search(r'<code>(.*?)</code>', upload.text or '')
+        msg = re.search(r'<msg>(.*?)</msg>', upload.text or '', re.DOTALL)
+        data = {'code': code.group(1) if code else None, 'msg': msg.group(1) if msg else None}
+        if upload.ok and data['code'] == UPLOAD_ACCEPTED:
+            return SscResponse(success=True, response_code=upload.status_code, data=data)
+        if upload.ok:
+            return SscResponse(success=False, response_code=upload.status_code, data=data,
+                               message="{} {}".format(data['code'], data['msg']))
+        return SscResponse(success=False, response_code=upload.status_code, data=data,
+                           message="{} {}".format(upload.status_code, upload.reason))
+
+    def __find_by_name__(self, url, name, page_size):
+        """
+        Let SSC filter url down to entries named name, paging until the exact match (SSC name searches are not
+        exact) is found. SSC releases that reject the filter are paged through unfiltered instead.
+        """
+        search = 'name:"{}"'.format(name.replace('"', '\\"'))
+        response = self.__find_in_pages__(url, name, {'q': search, 'fulltextsearch': 'false'}, page_size)
+        if not response.success and response.response_code == 400:
+            response = self.__find_in_pages__(url, name, {}, page_size)
+        return response
+
+    def __find_in_pages__(self, url, name, params, page_size):
+        response = None
+        for response in self.iter_pages(url, params=params, page_size=page_size):
+            if not response.success:
+                return response
+            for entry in response.data.get('data') or []:
+                if entry.get('name') == name:
+                    return SscResponse(success=True, response_code=response.response_code, data=entry)
+        return SscResponse(success=True, response_code=response.response_code, data=None)
+
+    def _request(self, method, url, params=None, json=None, data=None, files=None, headers=None, auth=None):
+        token = self.token_manager.get_token() if self.token_manager and not auth else None
+        response = self.__send__(method, url, token, params=params, json=json, data=data, files=files,
+                                 headers=headers, auth=auth)
+        if response.response_code == 401 and token:
+            token = self.token_manager.refresh_token(expired_token=token)
+            if token:
+                if files:
+                    # rewind uploads before sending them again
+                    for upload in files.values():
+                        upload[1].seek(0)
+                response = self.__send__(method, url, token, params=params, json=json, data=data, files=files,
+                                         headers=headers, auth=auth)
+        return response
+
+    def __send__(self, method, url, token, params=None, json=None, data=None, files=None, headers=None, auth=None):
+        headers = dict(headers) if headers else {}
+        if token:
+            headers['Authorization'] = 'FortifyToken {}'.format(token)
+        started = time.time()
+        response = None
+        try:
+            response = get_session().request(method=method, url=self.host + url, params=params, json=json,
+                                              data=data, files=files, headers=headers, auth=auth,
+                                              verify=self.verify_ssl, timeout=self.timeout)
+        except requests.exceptions.SSLError:
+            return SscResponse(message='An SSL error occurred.', success=False)
+        except requests.exceptions.ConnectionError:
+            return SscResponse(message='A connection error occurred.', success=False)
+        except requests.exceptions.Timeout:
+            return SscResponse(message='The request timed out after {} seconds.'.format(self.timeout),
+                               success=False)
+        except requests.exceptions.RequestException as e:
+            return SscResponse(message='There was an error while handling the request. {}'.format(e),
+                               success=False)
+        finally:
+            record_api_request('ssc', time.time() - started, response.status_code if response is not None else None)
+
+        try:
+            data = response.json() if response.text else ''
+        except ValueError as e:
+            data = ''
+            if response.ok:
+                return SscResponse(success=False, response_code=response.status_code,
+                                   message="JSON response could not be decoded {}.".format(e))
+
+        if response.ok:
+            return SscResponse(success=True, response_code=response.status_code, data=data)
+        return SscResponse(success=False, response_code=response.status_code, data=data,
+                           message="{} {}".format(response.status_code, response.reason))
+
+
+class StreamingMultipart(object):
+    """
+    File-like multipart/form-data body that reads the file from disk as it is sent. Its length is known up front,
+    so requests sends a Content-Length instead of buffering the body.
+    """
+    def __init__(self, file_path, fields=None, field_name='file', progress=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.file_size = os.path.getsize(file_path)
+        self.file = open(file_path, 'rb')
+
+        preamble = ''
+        for name, value in (fields or {}).items():
+            preamble += '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(self.boundary,
+                                                                                               name, value)
+        preamble += '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n' \
+                    'Content-Type: application/octet-stream\r\n\r\n'.format(self.boundary, field_name,
+                                                                            ntpath.basename(file_path))
+        self.preamble = preamble.encode('utf-8')
+        self.epilogue = '\r\n--{}--\r\n'.format(self.boundary).encode('utf-8')
+        self.length = len(self.preamble) + self.file_size + len(self.epilogue)
+        self.sent = 0
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        chunk = b''
+        while len(chunk) < size and self.sent + len(chunk) < self.length:
+            position = self.sent + len(chunk)
+            wanted = size - len(chunk)
+            if position < len(self.preamble):
+                chunk += self.preamble[position:position + wanted]
+            elif position < len(self.preamble) + self.file_size:
+                data = self.file.read(min(wanted, self.chunk_size))
+                if not data:
+                    raise IOError("{} changed size while uploading".format(self.file.name))
+                chunk += data
+            else:
+                offset = position - len(self.preamble) - self.file_size
+                chunk += self.epilogue[offset:offset + wanted]
+        self.sent += len(chunk)
+        if chunk and self.progress:
+            self.progress(self.sent, self.length)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+class SscResponse(object):
+    """Container for all SSC API responses, even errors."""
+
+    def __init__(self, success, message='OK', response_code=-1, data=None):
+        self.message = message
+        self.success = success
+        self.response_code = response_code
+        self.data = data
+
+    def __str__(self):
+        if self.data:
+            return str(self.data)
+        else:
+            return self.message
+
+    def data_json(self, pretty=False):
+        """Returns the data as a valid JSON string."""
+        if pretty:
+            return json.dumps(self.data, sort_keys=True, indent=4, separators=(',', ': '))
+        else:
+            return json.dumps(self.data)
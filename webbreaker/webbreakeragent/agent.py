@@ -4,139 +4,286 @@
 import time
 import sys
 import os
+import errno
+import heapq
+import itertools
+import random
+import signal
+import subprocess
+import threading
+import uuid
 from datetime import datetime
 import json
 import socket
-from __init__ import __version__
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+from webbreaker.webbreakeragent import __version__
+from webbreaker.webbreakeragent.journal import AgentJournal
+from webbreaker.webbreakeragent.agentlog import get_agent_log
+from webbreaker.webbreakeragent.intake import start_intake_server
 from webbreaker.notifiers.emailer import EmailNotifier
 from webbreaker.fortifyconfig import FortifyConfig
-from fortifyapi.fortify import FortifyApi
+from webbreaker.fortifytokenmanager import FortifyTokenManager
+from webbreaker.sscapi.ssc import SscApi, PAGE_SIZE
+from webbreaker.webbreakerhelper import file_lock
+from webbreaker.webbreakerconfigloader import load_config
+from webbreaker.webbreakermetrics import start_metrics, AGENT_JOBS, AGENT_JOBS_FINISHED, POLL_CYCLES, POLL_LATENCY
 
+AGENT_DIR = os.getenv('WEBBREAKER_AGENT_DIR', '/tmp/webbreaker_agent')
+# New jobs are dropped here by 'webbreaker admin agent --start' and picked up by the running daemon
+AGENT_SPOOL = os.path.join(AGENT_DIR, 'spool')
+AGENT_PIDFILE = os.path.join(AGENT_DIR, 'agent.pid')
+# One file per watched job, so a restarted daemon resumes every watch where it left off
+AGENT_STATE = os.path.join(AGENT_DIR, 'state')
+AGENT_ERROR_LOG = '/tmp/webbreaker_agent_error.log'
+# Threads talking to SSC, shared by every watched job
+AGENT_WORKERS = 4
+# Seconds between checks of the spool directory
+SPOOL_INTERVAL = 1
+# Spooled jobs not yet picked up, further intake submissions are refused with a 503
+INTAKE_QUEUE_SIZE = 1000
+# Hosts the intake server may listen on without an intake_token
+LOOPBACK_HOSTS = ['127.0.0.1', 'localhost', '::1']
+CHECK_INTERVAL = 15
+# Status checks back off exponentially (BACKOFF_FACTOR) while a job stays in the same state, starting over
+# whenever its state changes. Jobs in states about to end are checked at least every ACTIVE_MAX_INTERVAL
+# seconds, queued or idle jobs at least every IDLE_MAX_INTERVAL seconds.
+BACKOFF_FACTOR = 2
+ACTIVE_MAX_INTERVAL = 60
+IDLE_STATES = ['UNKNOWN', 'PENDING', 'QUEUED']
+IDLE_INTERVAL = 30
+IDLE_MAX_INTERVAL = 600
+# Every interval is randomized by +/- JITTER so jobs submitted together don't poll SSC in lockstep
+JITTER = 0.2
+# Kill any watch that is 3 days old
+AGENT_TIMEOUT = 259200
+# Attempts made to find the cloudscan job of a build, CHECK_INTERVAL apart
+FIND_ATTEMPTS = 7
+# Seconds the shared build id -> cloudscan job index is used before it is refreshed
+JOB_INDEX_TTL = CHECK_INTERVAL
+END_STATES = ['FAILURE', 'UPLOAD_COMPLETED']
+# Seconds between checks on end of watch emails being sent, and the attempts made before giving up on them
+NOTIFY_INTERVAL = 5
+NOTIFY_ATTEMPTS = 10
 
-class AgentClient(object):
-    def __init__(self, agent_json):
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def jitter(interval):
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def get_notifier():
+    """
+    :return: The EmailNotifier shared by every job, sending over one SMTP connection from its own thread
+    """
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = EmailNotifier()
+        return _notifier
+
+
+class AgentJob(object):
+    """
+    One cloudscan job watched by the agent: finds the job of a Fortify build id, follows its state until it ends
+    and then notifies the contributors. Each call to step does one unit of work and never sleeps, so one agent can
+    watch any number of jobs.
+    """
+    # Attributes persisted by state() and restored by restore()
+    STATE_FIELDS = ('job_id', 'payload', 'scan_id', 'started', 'interval', 'find_count', 'check_count')
+
+    def __init__(self, agent_data, journal=None, job_id=None):
+        self.journal = journal if journal else AgentJournal()
+        self.job_id = job_id if job_id else uuid.uuid4().hex
         self.pid = os.getpid()
         self.fqdn = socket.getfqdn()
-        data = self.__read_json__(agent_json)
-        try:
-            self.payload = self.__formatted_elk_payload__(scan=data['fortify_build_id'], host=self.fqdn, version=__version__,
-                                                          notifiers=data['git_emails'], git_url=data['git_url'],
-                                                          fortify_url=data['fortify_pv_url'])
-            self.payload['start'] = datetime.now().isoformat()
-            self.fortify_config = FortifyConfig()
-            self.check_count = 0
-            self.timeout = 15
-        except (KeyError, AttributeError, UnboundLocalError) as e:
-            self.log("Agent was either misconfigured or unable to initialize {0}\n".format(e))
-
-    def check(self):
+        self.scan_id = None
+        self.check_count = 0
+        self.find_count = 0
+        self.started = time.time()
+        self.interval = CHECK_INTERVAL
+        # Recipients of the end of watch email that have not been sent it yet
+        self.unnotified = []
+        self.notify_count = 0
+        # (recipient, Delivery) of the emails being sent, not persisted
+        self.deliveries = []
+        self.payload = self.__formatted_elk_payload__(scan=agent_data['fortify_build_id'], host=self.fqdn,
+                                                      version=__version__, notifiers=agent_data['git_emails'],
+                                                      git_url=agent_data['git_url'],
+                                                      fortify_url=agent_data['fortify_pv_url'])
+        self.payload['start'] = datetime.now().isoformat()
+
+    def state(self, next_check):
+        """
+        :param next_check: Epoch seconds this job is next due
+        :return: dict restore() rebuilds this job from
+        """
+        state = dict((name, getattr(self, name)) for name in self.STATE_FIELDS)
+        state['unnotified'] = self.unnotified
+        state['notify_count'] = self.notify_count
+        state['next_check'] = next_check
+        return state
+
+    @classmethod
+    def restore(cls, state, journal=None):
+        job = cls.__new__(cls)
+        job.journal = journal if journal else AgentJournal()
+        job.pid = os.getpid()
+        job.fqdn = socket.getfqdn()
+        for name in cls.STATE_FIELDS:
+            setattr(job, name, state[name])
+        job.unnotified = state.get('unnotified', [])
+        job.notify_count = state.get('notify_count', 0)
+        job.deliveries = []
+        return job
+
+    def watch_state(self):
+        """
+        :return: The last cloudscan job state seen, SEARCHING until the job of the build is found
+        """
+        if self.scan_id and self.payload['status']:
+            return self.payload['status'][-1]
+        return 'SEARCHING'
+
+    def step(self, api, job_index):
+        """
+        :param api: SscApi shared by the agent
+        :param job_index: CloudJobIndex shared by the agent
+        :return: Seconds until this job should be stepped again, None once the job is finished
+        """
+        if self.unnotified:
+            # the watch has ended, only its emails are left to send
+            return None
+        if not self.scan_id:
+            return self.find_job_id(job_index)
+        status = self.check(api)
+        if status is None:
+            return self.retry()
+        changed = status != self.payload['status'][-1]
+        if changed:
+            self.payload['status'].append(status)
+        if status in END_STATES:
+            self.log("WATCH", "END")
+            self.end()
+            return None
+        if self.check_timeout():
+            return None
+        return self.__next_interval__(status, changed)
+
+    def check(self, api):
         self.check_count += 1
-        try:
-            api = FortifyApi(host=self.fortify_config.ssc_url, username=self.fortify_config.username,
-                             password=self.fortify_config.password, verify_ssl=False)
-    
-            response = api.get_cloudscan_job_status(self.scan_id)
-        except (KeyError, AttributeError, UnboundLocalError) as e:
-            self.log("Agent was either misconfigured or unable to communicate with Fortify SSC {0}\n".format(e))
-        
+        response = api.get_cloudscan_job_status(self.scan_id)
         if response.success:
             self.log("CHECK", response.data['data']['jobState'])
             return response.data['data']['jobState']
         else:
             self.log("CHECK FAILURE", 'API REQUEST FAILED')
-            sys.exit()
+            return None
 
     def check_timeout(self):
-        time_running = self.timeout * self.check_count
-        # Kill any agent that is 3 days old
-        if time_running > 259200:
+        time_running = int(time.time() - self.started)
+        if time_running > AGENT_TIMEOUT:
             self.payload['status'].append('AGENT TIMEOUT')
-            self.write_json()
             self.log("AGENT TIMEOUT", 'AGENT KILLED AFTER {} SECONDS'.format(time_running))
-            sys.exit()
+            self.end()
+            return True
+        return False
 
-    def find_job_id(self):
-        try:
-            api = FortifyApi(host=self.fortify_config.ssc_url, username=self.fortify_config.username,
-                             password=self.fortify_config.password, verify_ssl=False)
-            response = api.get_cloudscan_jobs()
-        except (AttributeError, UnboundLocalError) as e:
-            self.log("Agent was either misconfigured or unable to communicate with agent {0}\n".format(e))
-            
-        if response.success:
-            for scan in response.data['data']:
-                if scan['scaBuildId'] == self.payload['scan']:
-                    self.scan_id = scan['jobToken']
-                    self.log('SCAN FOUND', self.scan_id)
-                    self.payload['status'].append(scan['jobState'])
-                    return
-            for i in range(0,6):
-                time.sleep(15)
-                response = api.get_cloudscan_jobs()
-                for scan in response.data['data']:
-                    if scan['scaBuildId'] == self.payload['scan']:
-                        self.scan_id = scan['jobToken']
-                        self.log('SCAN FOUND', self.scan_id)
-                        self.payload['status'].append(scan['jobState'])
-                        return
-            self.scan_id = None
-            self.log('NO SCAN FOUND', "No scan was found within 1 minute")
+    def retry(self):
+        """
+        Back off after a failed SSC request, the watch is only given up once it times out.
+        :return: Seconds until the next attempt, None if the watch has timed out
+        """
+        if self.check_timeout():
+            return None
+        self.interval = min(IDLE_MAX_INTERVAL, max(CHECK_INTERVAL, self.interval * BACKOFF_FACTOR))
+        return jitter(self.interval)
+
+    def __next_interval__(self, status, changed):
+        """
+        :return: Seconds until the next status check, given the state just seen and whether it changed
+        """
+        if status in IDLE_STATES:
+            base, ceiling = IDLE_INTERVAL, IDLE_MAX_INTERVAL
+        else:
+            base, ceiling = CHECK_INTERVAL, ACTIVE_MAX_INTERVAL
+        if changed:
+            self.interval = base
         else:
-            self.scan_id = None
-            self.log('NO SCAN FOUND', response.message)
+            self.interval = min(ceiling, max(base, self.interval * BACKOFF_FACTOR))
+        return jitter(self.interval)
+
+    def find_job_id(self, job_index):
+        scan, error = job_index.find(self.payload['scan'])
+        if error:
+            # failed lookups don't count against FIND_ATTEMPTS
+            self.log('FIND FAILURE', error)
+            return self.retry()
+        self.find_count += 1
+
+        if scan:
+            self.scan_id = scan['jobToken']
+            self.log('SCAN FOUND', self.scan_id)
+            self.payload['status'].append(scan['jobState'])
+            self.log("WATCH", "START")
+            return 0
+        if self.find_count < FIND_ATTEMPTS:
+            return jitter(CHECK_INTERVAL)
+        self.log('NO SCAN FOUND', "No scan was found within {} seconds".format(CHECK_INTERVAL * (FIND_ATTEMPTS - 1)))
+        return None
 
     def log(self, action, value):
-        with open('/tmp/webbreaker_agent.log', 'a') as log_file:
-            log_file.write("{}|{}|{}|{}\n".format(self.pid, datetime.now().isoformat(), action, value))
-        log_file.close()
+        get_agent_log().write("{}|{}|{}|{}|{}".format(self.pid, datetime.now().isoformat(), self.payload['scan'],
+                                                      action, value))
 
-    def notify(self):
-        subject = "Static Scan Notification"
-        notifier = EmailNotifier()
+    def end(self):
+        """
+        Record the end of the watch in the journal and mark every contributor to be emailed by notify().
+        """
+        self.payload['end'] = datetime.now().isoformat()
+        notifier = get_notifier()
         if notifier.default_to_address:
             self.payload['notifiers'].append(notifier.default_to_address)
-        for email in self.payload['notifiers']:
-            notifier.cloudscan_notify(recipient=email, subject=subject, git_url=self.payload['git_url'],
-                                      ssc_url=self.payload['fortify_url'], state=self.payload['status'][-1],
-                                      scan_name=self.payload['scan'], scan_id=self.scan_id)
-
-    def run(self):
-        agent.find_job_id()
-        if not agent.scan_id:
-            sys.exit()
-        response = agent.watch()
-        agent.notify()
-        agent.write_json()
-
-    def watch(self):
-        self.log("WATCH", "START")
-        status = self.check()
-        end_states = ['FAILURE', 'UPLOAD_COMPLETED']
-        while status not in end_states:
-            time.sleep(self.timeout)
-            status = self.check()
-            if status != self.payload['status'][-1]:
-                self.payload['status'].append(status)
-            self.check_timeout()
-        self.log("WATCH", "END")
-        self.payload['end'] = datetime.now().isoformat()
-        return status
+        self.unnotified = list(self.payload['notifiers'])
+        self.write_json()
+
+    def notify(self):
+        """
+        Email every contributor not notified yet. The emails are sent by the notifier's own thread, later calls
+        check on them without waiting and count the attempt once every email has been sent or has failed.
+        :return: Seconds until this should be called again, None once done
+        """
+        if not self.deliveries:
+            subject = "Static Scan Notification"
+            notifier = get_notifier()
+            self.deliveries = [(email, notifier.cloudscan_notify(recipient=email, subject=subject,
+                                                                 git_url=self.payload['git_url'],
+                                                                 ssc_url=self.payload['fortify_url'],
+                                                                 state=self.payload['status'][-1],
+                                                                 scan_name=self.payload['scan'], scan_id=self.scan_id))
+                               for email in self.unnotified]
+        if any(delivery is not None and not delivery.done.is_set() for email, delivery in self.deliveries):
+            return jitter(NOTIFY_INTERVAL)
+
+        self.notify_count += 1
+        self.unnotified = [email for email, delivery in self.deliveries if delivery is None or not delivery.sent]
+        self.deliveries = []
+        if not self.unnotified:
+            self.log("NOTIFY", "SENT")
+            return None
+        if self.notify_count >= NOTIFY_ATTEMPTS:
+            self.log("NOTIFY FAILURE", "Gave up on {}".format(', '.join(self.unnotified)))
+            self.unnotified = []
+            return None
+        self.log("NOTIFY RETRY", ', '.join(self.unnotified))
+        return jitter(min(IDLE_MAX_INTERVAL, CHECK_INTERVAL * BACKOFF_FACTOR ** self.notify_count))
 
     def write_json(self):
-        if os.path.isfile('/tmp/webbreaker.json'):
-            with open('/tmp/webbreaker.json', 'r') as json_file:
-                try:
-                    logs = json.load(json_file)
-                except json.decoder.JSONDecodeError:
-                    logs = {'logs': []}
-                    pass
-            json_file.close()
-        else:
-            logs = {'logs':[]}
-        logs['logs'].append(self.payload)
-        with open('/tmp/webbreaker.json', 'w') as json_file:
-            json.dump(logs, json_file, sort_keys=True, indent=4, separators=(',', ': '))
-        json_file.close()
+        self.journal.append(self.payload)
 
     @staticmethod
     def __formatted_elk_payload__(scan, host, version, notifiers, git_url, fortify_url):
@@ -153,23 +300,377 @@ class AgentClient(object):
 
         return elk_json
 
-    def __read_json__(self, file_path):
-        if os.path.isfile(file_path):
-            with open(file_path, 'r') as json_file:
-                try:
-                    data = json.load(json_file)
-                except json.decoder.JSONDecodeError:
-                    return None
-                json_file.close()
-            return data
-        else:
+
+class CloudJobIndex(object):
+    """
+    Resolves Fortify build ids to cloudscan jobs for every job the agent watches. SSC is asked for the one build
+    id (q=scaBuildId) when it supports that filter; otherwise every page of the job listing, refreshed at most
+    every ttl seconds, is indexed by build id and shared by all lookups.
+    """
+    def __init__(self, api, ttl=JOB_INDEX_TTL):
+        self.api = api
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.refreshed = None
+        # None until the first filtered query shows whether SSC applies the filter
+        self.server_filter = None
+
+    def find(self, build_id):
+        """
+        :return: (job or None, error message or None)
+        """
+        if self.server_filter is not False:
+            response = self.api.get_cloudscan_jobs(params={'q': 'scaBuildId:"{}"'.format(build_id), 'start': 0,
+                                                           'limit': PAGE_SIZE})
+            if response.success:
+                jobs = response.data['data']
+                if all(job['scaBuildId'] == build_id for job in jobs):
+                    self.server_filter = True
+                    return (jobs[0] if jobs else None), None
+                self.server_filter = False
+                if len(jobs) >= response.data.get('count', 0):
+                    # SSC ignored the filter and listed every job, index those instead of asking again
+                    with self.lock:
+                        self.__index__(jobs)
+                        return self.jobs.get(build_id), None
+            elif response.response_code == 400:
+                self.server_filter = False
+            else:
+                return None, response.message
+
+        with self.lock:
+            if self.refreshed is None or time.time() - self.refreshed > self.ttl:
+                jobs = []
+                for response in self.api.iter_cloudscan_jobs():
+                    if not response.success:
+                        return None, response.message
+                    jobs.extend(response.data['data'])
+                self.__index__(jobs)
+            return self.jobs.get(build_id), None
+
+    def __index__(self, jobs):
+        """
+        Replace the index with jobs, the caller holds self.lock.
+        """
+        indexed = {}
+        # Keep the first job listed for a build id, as the old linear scan did
+        for job in reversed(jobs):
+            indexed[job['scaBuildId']] = job
+        self.jobs = indexed
+        self.refreshed = time.time()
+
+
+class AgentClient(object):
+    """
+    Agent daemon: one process watches every submitted cloudscan job. Jobs are kept in a heap ordered by when they
+    are next due and are stepped by a small pool of worker threads sharing one SSC session and token.
+    """
+    def __init__(self, spool_dir=AGENT_SPOOL, workers=AGENT_WORKERS, state_dir=AGENT_STATE):
+        self.spool_dir = spool_dir
+        self.state_dir = state_dir
+        self.workers = workers
+        self.fortify_config = FortifyConfig()
+        token_manager = FortifyTokenManager(self.fortify_config.ssc_url, token=self.fortify_config.token,
+                                            token_expiry=self.fortify_config.token_expiry,
+                                            username=self.fortify_config.username,
+                                            password=self.fortify_config.password,
+                                            on_refresh=self.fortify_config.write_credentials)
+        self.api = SscApi(self.fortify_config.ssc_url, token_manager=token_manager, verify_ssl=False)
+        self.job_index = CloudJobIndex(self.api)
+        self.journal = AgentJournal()
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.ready = queue.Queue()
+        self.intake_server = None
+        self.running = False
+
+    def add_job(self, agent_data, delay=0, job_id=None):
+        try:
+            job = AgentJob(agent_data, journal=self.journal, job_id=job_id)
+        except (KeyError, TypeError) as e:
+            self.log("Agent was either misconfigured or unable to initialize {0}".format(e))
             return None
+        self.__save_state__(job, time.time() + delay)
+        AGENT_JOBS.inc(state=job.watch_state())
+        self.__schedule__(job, delay)
+        return job
+
+    def serve(self):
+        """
+        Run until SIGTERM or SIGINT.
+        """
+        if not os.path.isdir(os.path.dirname(AGENT_PIDFILE)):
+            os.makedirs(os.path.dirname(AGENT_PIDFILE))
+        # Two submissions racing to start the daemon must leave only one running
+        with file_lock(AGENT_PIDFILE + '.lock'):
+            if self.is_running():
+                self.log("Agent already running, exiting")
+                return
+            self.__write_pidfile__()
+        self.running = True
+        self.journal.migrate()
+        self.__restore_jobs__()
+        self.__start_intake__()
+        start_metrics('agent', serve=True)
+        signal.signal(signal.SIGTERM, self.__stop__)
+        signal.signal(signal.SIGINT, self.__stop__)
+        threads = [threading.Thread(target=self.__worker__) for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        self.log("Agent {} started with {} workers".format(os.getpid(), self.workers))
+
+        try:
+            while self.running:
+                self.__collect_spool__()
+                with self.condition:
+                    now = time.time()
+                    while self.schedule and self.schedule[0][0] <= now:
+                        due, sequence, job = heapq.heappop(self.schedule)
+                        self.ready.put(job)
+                    wait = SPOOL_INTERVAL
+                    if self.schedule:
+                        wait = min(wait, max(0, self.schedule[0][0] - now))
+                    self.condition.wait(wait)
+        finally:
+            if self.intake_server:
+                self.intake_server.shutdown()
+            self.__remove_pidfile__()
+            if _notifier is not None:
+                _notifier.flush()
+            self.log("Agent {} stopped".format(os.getpid()))
+            get_agent_log().flush()
+
+    def accept(self, agent_data):
+        """
+        Spool a verified submission from the intake server, so it is on disk before the submitter is answered.
+        :return: The new job id, None if the spool is full or could not be written
+        """
+        try:
+            if len(os.listdir(self.spool_dir)) >= INTAKE_QUEUE_SIZE:
+                return None
+        except OSError:
+            pass
+        try:
+            job_id = self.submit(agent_data, self.spool_dir)
+        except (IOError, OSError) as e:
+            self.log("Unable to spool submission: {}".format(e))
+            return None
+        with self.condition:
+            self.condition.notify_all()
+        return job_id
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def log(self, value):
+        get_agent_log().write("{}|{}|AGENT|{}".format(os.getpid(), datetime.now().isoformat(), value))
+
+    @staticmethod
+    def submit(agent_data, spool_dir=AGENT_SPOOL):
+        """
+        Hand a job to the agent daemon by writing it into the spool directory.
+        :return: The job id, the name of the spool file
+        """
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir)
+        name = "{:.6f}-{}".format(time.time(), uuid.uuid4().hex)
+        temp_file = os.path.join(spool_dir, '.' + name)
+        with open(temp_file, 'w') as spool_file:
+            json.dump(agent_data, spool_file)
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+        # Only complete files ever carry the .json extension the daemon looks for
+        os.rename(temp_file, os.path.join(spool_dir, name + '.json'))
+        return name
+
+    @staticmethod
+    def is_running(pidfile=AGENT_PIDFILE):
+        try:
+            with open(pidfile, 'r') as pid_file:
+                pid = int(pid_file.read().strip())
+            os.kill(pid, 0)
+            return True
+        except (IOError, OSError, ValueError) as e:
+            if isinstance(e, OSError) and e.errno == errno.EPERM:
+                return True
+            return False
+
+    @staticmethod
+    def start_daemon():
+        """
+        Start the agent daemon in the background, detached from the calling process.
+        """
+        with open(AGENT_ERROR_LOG, 'a') as error_log:
+            subprocess.Popen([sys.executable, '-m', 'webbreaker.webbreakeragent.agent', '--daemon'],
+                             stdout=error_log, stderr=error_log, stdin=open(os.devnull, 'r'), close_fds=True,
+                             preexec_fn=os.setsid)
+
+    def __schedule__(self, job, delay):
+        with self.condition:
+            heapq.heappush(self.schedule, (time.time() + delay, next(self.sequence), job))
+            self.condition.notify_all()
+
+    def __worker__(self):
+        while True:
+            job = self.ready.get()
+            state = job.watch_state()
+            # Jobs only waiting on their emails don't poll SSC
+            action = None if job.unnotified else 'check' if job.scan_id else 'find'
+            started = time.time()
+            try:
+                delay = job.step(self.api, self.job_index)
+            except Exception as e:
+                job.log("ERROR", e)
+                delay = job.retry()
+            if delay is None and job.unnotified:
+                if not job.deliveries:
+                    # The state file marks the emails as pending until they are sent, so a crash doesn't lose them
+                    self.__save_state__(job, time.time())
+                try:
+                    delay = job.notify()
+                except Exception as e:
+                    job.log("ERROR", e)
+                    job.deliveries = []
+                    job.notify_count += 1
+                    delay = jitter(CHECK_INTERVAL) if job.notify_count < NOTIFY_ATTEMPTS else None
+            if action:
+                POLL_CYCLES.inc(action=action)
+                POLL_LATENCY.observe(time.time() - started, action=action)
+            AGENT_JOBS.dec(state=state)
+            if delay is not None:
+                AGENT_JOBS.inc(state=job.watch_state())
+                self.__save_state__(job, time.time() + delay)
+                self.__schedule__(job, delay)
+            else:
+                AGENT_JOBS_FINISHED.inc(state=job.watch_state())
+                self.__remove_state__(job)
+
+    def __collect_spool__(self):
+        try:
+            names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            # The spool file name doubles as the job id, so a job saved just before a crash is not added twice
+            job_id = name[:-len('.json')]
+            try:
+                with open(path, 'r') as spool_file:
+                    agent_data = json.load(spool_file)
+            except (IOError, ValueError) as e:
+                self.log("Skipping unreadable job {}: {}".format(path, e))
+                agent_data = None
+            if agent_data and not os.path.isfile(self.__state_file__(job_id)):
+                self.add_job(agent_data, job_id=job_id)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __start_intake__(self):
+        """
+        Serve agent.json submissions over HTTP when intake_port is set in the [agent] section of webbreaker.ini.
+        Submissions must carry intake_token when it is set, and without one only loopback hosts are served.
+        """
+        try:
+            config = load_config('webbreaker')
+            if not config.has_option('agent', 'intake_port') or not config.get('agent', 'intake_port'):
+                return
+            host = '127.0.0.1'
+            if config.has_option('agent', 'intake_host') and config.get('agent', 'intake_host'):
+                host = config.get('agent', 'intake_host')
+            port = int(config.get('agent', 'intake_port'))
+            token = None
+            if config.has_option('agent', 'intake_token'):
+                token = config.get('agent', 'intake_token') or None
+            if not token and host not in LOOPBACK_HOSTS:
+                self.log("Refusing to serve intake on {} without an intake_token".format(host))
+                return
+            self.intake_server = start_intake_server((host, port), self.accept, token=token)
+            self.log("Accepting submissions on {}:{}".format(host, port))
+        except (ValueError, socket.error) as e:
+            self.log("Unable to start the intake server: {}".format(e))
+
+    def __restore_jobs__(self):
+        """
+        Resume every watch saved by a previous daemon, keeping its job token and next check time.
+        """
+        try:
+            names = sorted(name for name in os.listdir(self.state_dir) if name.endswith('.json'))
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            try:
+                with open(os.path.join(self.state_dir, name), 'r') as state_file:
+                    state = json.load(state_file)
+                job = AgentJob.restore(state, journal=self.journal)
+            except (IOError, ValueError, KeyError) as e:
+                self.log("Skipping unreadable job state {}: {}".format(name, e))
+                continue
+            AGENT_JOBS.inc(state=job.watch_state())
+            self.__schedule__(job, max(0, state.get('next_check', now) - now))
+            job.log("RESUME", job.scan_id)
+
+    def __state_file__(self, job_id):
+        return os.path.join(self.state_dir, job_id + '.json')
+
+    def __save_state__(self, job, next_check):
+        try:
+            if not os.path.isdir(self.state_dir):
+                os.makedirs(self.state_dir)
+            state_file = self.__state_file__(job.job_id)
+            temp_file = os.path.join(self.state_dir, '.' + job.job_id)
+            with open(temp_file, 'w') as state_json:
+                json.dump(job.state(next_check), state_json)
+            os.rename(temp_file, state_file)
+        except (IOError, OSError) as e:
+            job.log("STATE", "Unable to save state: {}".format(e))
+
+    def __remove_state__(self, job):
+        try:
+            os.remove(self.__state_file__(job.job_id))
+        except OSError:
+            pass
+
+    def __write_pidfile__(self):
+        with open(AGENT_PIDFILE, 'w') as pid_file:
+            pid_file.write(str(os.getpid()))
+
+    def __remove_pidfile__(self):
+        try:
+            os.remove(AGENT_PIDFILE)
+        except OSError:
+            pass
+
+    def __stop__(self, signum, frame):
+        self.stop()
+
+
+def read_agent_json(file_path):
+    if os.path.isfile(file_path):
+        with open(file_path, 'r') as json_file:
+            try:
+                return json.load(json_file)
+            except ValueError:
+                return None
+    return None
 
 
 if __name__ == '__main__':
-    f = open('/tmp/webbreaker_agent_error.log', 'a')
+    f = open(AGENT_ERROR_LOG, 'a')
     sys.stdout = f
     sys.stderr = f
 
-    agent = AgentClient(sys.argv[1])
-    agent.run()
+    if sys.argv[1:] == ['--daemon']:
+        AgentClient().serve()
+    else:
+        # Submit an agent.json to the daemon, starting it if needed
+        AgentClient.submit(read_agent_json(sys.argv[1]))
+        if not AgentClient.is_running():
+            AgentClient.start_daemon()
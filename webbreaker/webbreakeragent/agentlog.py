@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import os
+import threading
+from webbreaker.webbreakerlogger import LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+AGENT_LOG = '/tmp/webbreaker_agent.log'
+# Buffered lines are written out every FLUSH_INTERVAL seconds, or sooner once FLUSH_LINES lines are waiting
+FLUSH_INTERVAL = 5
+FLUSH_LINES = 500
+
+_agent_log = None
+_agent_log_lock = threading.Lock()
+
+
+class AgentLog(object):
+    """
+    Thread-safe, buffered writer for the agent event log. Lines are collected in memory and written with one
+    write per flush, on an interval, when enough lines are buffered and at exit. The file is rotated like the
+    other WebBreaker logs once it reaches max_bytes.
+    """
+    def __init__(self, path=AGENT_LOG, flush_interval=FLUSH_INTERVAL, flush_lines=FLUSH_LINES,
+                 max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.__flush_periodically__, name='AgentLogFlusher')
+        self.flusher.daemon = True
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def write(self, line):
+        with self.lock:
+            self.buffer.append(line if line.endswith('\n') else line + '\n')
+            if len(self.buffer) >= self.flush_lines:
+                self.__flush__()
+
+    def flush(self):
+        with self.lock:
+            self.__flush__()
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.flush()
+
+    def __flush_periodically__(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def __flush__(self):
+        # Only called with self.lock held
+        if not self.buffer:
+            return
+        data = ''.join(self.buffer)
+        self.buffer = []
+        try:
+            if self.max_bytes and os.path.isfile(self.path) and \
+                    os.path.getsize(self.path) + len(data) > self.max_bytes:
+                self.__rotate__()
+            with open(self.path, 'a') as log_file:
+                log_file.write(data)
+        except (IOError, OSError):
+            # never let agent logging take down a watch
+            pass
+
+    def __rotate__(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = "{}.{}".format(self.path, index)
+            if os.path.isfile(source):
+                os.rename(source, "{}.{}".format(self.path, index + 1))
+        if self.backup_count:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+
+def get_agent_log():
+    """
+    :return: The AgentLog shared by every job in this process
+    """
+    global _agent_log
+    with _agent_log_lock:
+        if _agent_log is None:
+            _agent_log = AgentLog()
+        return _agent_log
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hmac
+import json
+import threading
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+except ImportError:  # Python3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+from webbreaker.gitclient import TOKEN_HEADER
+try:
+    string_types = basestring
+except NameError:  # Python3
+    string_types = str
+
+# Larger submissions are refused, an agent.json is a few hundred bytes
+MAX_BODY_BYTES = 64 * 1024
+# Fields that carry a list, every other form field takes its first value
+LIST_FIELDS = ['git_emails']
+# Fields every submission must carry, as non-empty strings or for LIST_FIELDS a non-empty list of them
+REQUIRED_FIELDS = ['git_emails', 'git_url', 'fortify_pv_url', 'fortify_build_id']
+
+
+class IntakeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, submit, token=None):
+        """
+        :param submit: Callable taking the verified agent data, returning a job id or None when the agent is busy
+        :param token: Shared secret every submission must send in the TOKEN_HEADER header
+        """
+        HTTPServer.__init__(self, address, IntakeHandler)
+        self.submit = submit
+        self.token = token
+
+
+class IntakeHandler(BaseHTTPRequestHandler):
+    """
+    Accepts the agent.json submissions GitUploader PUTs (form encoded) or POSTs (JSON), verifies them and hands
+    them to the agent without waiting for any SSC work.
+    """
+    def do_PUT(self):
+        self.__intake__()
+
+    def do_POST(self):
+        self.__intake__()
+
+    def __intake__(self):
+        if self.server.token and not hmac.compare_digest(encoded(self.headers.get(TOKEN_HEADER, '')),
+                                                         encoded(self.server.token)):
+            return self.__respond__(401, {'error': 'Missing or invalid {} header'.format(TOKEN_HEADER)})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        if length > MAX_BODY_BYTES:
+            return self.__respond__(413, {'error': 'Submission too large'})
+
+        try:
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            data = self.__parse__(body)
+        except ValueError as e:
+            return self.__respond__(400, {'error': 'Invalid submission: {}'.format(e)})
+
+        job_id = self.server.submit(data)
+        if not job_id:
+            return self.__respond__(503, {'error': 'Agent queue is full, retry later'})
+        self.__respond__(202, {'job_id': job_id})
+
+    def __parse__(self, body):
+        """
+        :return: The submitted agent data
+        :raises ValueError: When the body can't be parsed or a required field is missing or of the wrong type
+        """
+        if 'json' in self.headers.get('Content-Type', ''):
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+        else:
+            data = {}
+            for field, values in parse_qs(body).items():
+                data[field] = values if field in LIST_FIELDS else values[0]
+
+        for field in REQUIRED_FIELDS:
+            value = data.get(field)
+            if field in LIST_FIELDS:
+                if not isinstance(value, list) or not value or \
+                        not all(isinstance(item, string_types) and item for item in value):
+                    raise ValueError("{} must be a non-empty list of strings".format(field))
+            elif not isinstance(value, string_types) or not value:
+                raise ValueError("{} must be a non-empty string".format(field))
+        return data
+
+    def __respond__(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are already visible in the agent log through the jobs they create
+        pass
+
+
+def encoded(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def start_intake_server(address, submit, token=None):
+    """
+    Serve submissions on address from a background thread.
+    :return: The running IntakeServer, call shutdown() to stop it
+    """
+    server = IntakeServer(address, submit, token=token)
+    thread = threading.Thread(target=server.serve_forever, name='AgentIntake')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from collections import deque
+from webbreaker.webbreakerhelper import file_lock
+
+JOURNAL_FILE = '/tmp/webbreaker.ndjson'
+# Older agents rewrote this file on every result
+LEGACY_JSON = '/tmp/webbreaker.json'
+# The journal is compacted down to the newest JOURNAL_MAX_ENTRIES results once it grows past JOURNAL_COMPACT_BYTES
+JOURNAL_COMPACT_BYTES = 16 * 1024 * 1024
+JOURNAL_MAX_ENTRIES = 10000
+
+
+class AgentJournal(object):
+    """
+    Append-only NDJSON journal of agent results, one ELK payload per line. Appends are a single write to a file
+    opened in append mode, taken under the journal lock so they never interleave with a compaction.
+    """
+    def __init__(self, path=JOURNAL_FILE, compact_bytes=JOURNAL_COMPACT_BYTES, max_entries=JOURNAL_MAX_ENTRIES):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.compact_bytes = compact_bytes
+        self.max_entries = max_entries
+
+    def append(self, payload):
+        line = json.dumps(payload, sort_keys=True) + '\n'
+        with file_lock(self.lock_path):
+            with open(self.path, 'a') as journal:
+                journal.write(line)
+            size = os.path.getsize(self.path)
+            if size > self.compact_bytes:
+                self.__compact__()
+
+    def read(self, scan=None):
+        """
+        :param scan: Only yield payloads of this Fortify build id
+        :return: Generator of payloads, oldest first
+        """
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r') as journal:
+            for line in journal:
+                try:
+                    payload = json.loads(line)
+                except ValueError:
+                    # a line still being written by another process
+                    continue
+                if scan is None or payload.get('scan') == scan:
+                    yield payload
+
+    def latest(self, scan):
+        """
+        :return: The newest payload of the Fortify build id scan, or None
+        """
+        payload = None
+        for payload in self.read(scan=scan):
+            pass
+        return payload
+
+    def compact(self):
+        with file_lock(self.lock_path):
+            self.__compact__()
+
+    def migrate(self, legacy_file=LEGACY_JSON):
+        """
+        Move the results of a {'logs': [...]} file written by older agents into the journal.
+        """
+        if not os.path.isfile(legacy_file):
+            return
+        try:
+            with open(legacy_file, 'r') as json_file:
+                logs = json.load(json_file).get('logs', [])
+        except (IOError, ValueError, AttributeError):
+            return
+        with file_lock(self.lock_path):
+            with open(self.path, 'a') as journal:
+                journal.write(''.join(json.dumps(payload, sort_keys=True) + '\n' for payload in logs))
+            os.rename(legacy_file, legacy_file + '.migrated')
+
+    def __compact__(self):
+        # Only called with the journal lock held
+        entries = deque(self.read(), maxlen=self.max_entries)
+        temp_file = "{}.{}".format(self.path, os.getpid())
+        with open(temp_file, 'w') as journal:
+            journal.write(''.join(json.dumps(payload, sort_keys=True) + '\n' for payload in entries))
+        os.rename(temp_file, self.path)
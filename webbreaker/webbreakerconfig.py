@@ -11,15 +11,10 @@ from webbreaker.webbreakerhelper import WebBreakerHelper
 from webbreaker.notifiers import emailer
 from webbreaker.webbreakerlogger import Logger
 from webbreaker.notifiers import reporter
+from webbreaker.webbreakerconfigloader import load_config
 
 runenv = WebBreakerHelper.check_run_env()
 
-# TODO: Test on Python2
-try:  # Python 2
-    config = configparser.SafeConfigParser()
-except NameError:  # Python 3
-    config = configparser.ConfigParser()
-
 
 class WebBreakerConfig(object):
     def parse_fortify_settings(self):
@@ -27,7 +22,7 @@ class WebBreakerConfig(object):
         fortify_setting = os.path.abspath(os.path.join('webbreaker', 'etc', 'fortify.ini'))
         if os.path.exists(fortify_setting):
             fortify_dict = {}
-            config.read(fortify_setting)
+            config = load_config('fortify')
 
             try:
                 fortify_dict['fortify_url'] = config.get("fortify", "ssc_url")
@@ -45,7 +40,7 @@ class WebBreakerConfig(object):
         emailer_dict = {}
         emailer_setting = os.path.abspath(os.path.join('webbreaker', 'etc', 'email.ini'))
         if os.path.exists(emailer_setting):
-            config.read(emailer_setting)
+            config = load_config('email')
 
             try:
                 emailer_dict['smtp_host'] = config.get('emailer', 'smtp_host')
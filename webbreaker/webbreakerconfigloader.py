@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+try:
+    import ConfigParser as configparser
+except ImportError: #Python3
+    import configparser
+import os
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from webbreaker.webbreakerlogger import Logger
+
+CONFIG_DIR = os.path.abspath(os.path.join('webbreaker', 'etc'))
+INI_FILES = OrderedDict([('webbreaker', os.path.join(CONFIG_DIR, 'webbreaker.ini')),
+                         ('fortify', os.path.join(CONFIG_DIR, 'fortify.ini')),
+                         ('webinspect', os.path.join(CONFIG_DIR, 'webinspect.ini')),
+                         ('email', os.path.join(CONFIG_DIR, 'email.ini'))])
+SNAPSHOT_FILE = os.path.join(CONFIG_DIR, '.config_snapshot.json')
+
+_lock = threading.Lock()
+_snapshot = None
+_fingerprint = None
+# Default of IniSnapshot.get's fallback, so None can be passed as a fallback like with ConfigParser
+_UNSET = object()
+
+
+class IniSnapshot(object):
+    """
+    Read-only, already interpolated view of one ini file. Mirrors the parts of the ConfigParser API WebBreaker
+    uses, including its NoSectionError/NoOptionError exceptions, so each ini file is read through its own view
+    and sections from different files can never bleed together. raw_sections holds the uninterpolated values.
+    """
+    def __init__(self, path, sections, raw_sections=None):
+        self.path = path
+        self.sections = sections
+        self.raw_sections = raw_sections if raw_sections is not None else sections
+
+    def has_section(self, section):
+        return section in self.sections
+
+    def has_option(self, section, option):
+        return section in self.sections and option.lower() in self.sections[section]
+
+    def options(self, section):
+        if section not in self.sections:
+            raise configparser.NoSectionError(section)
+        return list(self.sections[section].keys())
+
+    def items(self, section):
+        if section not in self.sections:
+            raise configparser.NoSectionError(section)
+        return list(self.sections[section].items())
+
+    def get(self, section, option, raw=False, vars=None, fallback=_UNSET):
+        """
+        Same as ConfigParser.get: raw skips interpolation, vars take precedence over the section's options and
+        fallback is returned instead of raising NoSectionError or NoOptionError.
+        """
+        try:
+            if vars:
+                return self.__parser__().get(section, option, raw=raw, vars=vars)
+            if section not in self.sections:
+                raise configparser.NoSectionError(section)
+            if option.lower() not in self.sections[section]:
+                raise configparser.NoOptionError(option, section)
+            return (self.raw_sections if raw else self.sections)[section][option.lower()]
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            if fallback is _UNSET:
+                raise
+            return fallback
+
+    def __parser__(self):
+        """
+        :return: A ConfigParser holding the raw values, for lookups that have to interpolate with vars
+        """
+        parser = __new_parser__()
+        for section, options in self.raw_sections.items():
+            parser.add_section(section)
+            for option, value in options.items():
+                parser.set(section, option, value)
+        return parser
+
+
+def load_config(ini):
+    """
+    :param ini: One of webbreaker, fortify, webinspect or email
+    :return: IniSnapshot of webbreaker/etc/<ini>.ini
+    """
+    snapshot = __load_snapshot__()
+    return IniSnapshot(INI_FILES[ini], snapshot['config'].get(ini, OrderedDict()),
+                       snapshot['raw'].get(ini, OrderedDict()))
+
+
+def invalidate_config():
+    """
+    Drop the in-process snapshot, e.g. after writing to one of the ini files.
+    """
+    global _snapshot, _fingerprint
+    with _lock:
+        _snapshot = None
+        _fingerprint = None
+
+
+def __load_snapshot__():
+    """
+    All ini files are parsed at most once per process, until the size, inode or any timestamp of one of them
+    changes. The parsed result is also compiled into SNAPSHOT_FILE, keyed by a hash of every ini file's contents,
+    so later invocations load one JSON document instead of re-parsing each file until one of them changes.
+    :return: dict of 'config' and 'raw', each mapping every ini to its sections
+    """
+    global _snapshot, _fingerprint
+    fingerprint = __fingerprint__()
+    with _lock:
+        if _snapshot is not None and _fingerprint == fingerprint:
+            return _snapshot
+
+        digest = __digest__()
+        snapshot = __read_snapshot_file__(digest)
+        if snapshot is None:
+            snapshot = {'config': OrderedDict(), 'raw': OrderedDict()}
+            for ini, path in INI_FILES.items():
+                snapshot['config'][ini], snapshot['raw'][ini] = __parse_ini__(path)
+            __write_snapshot_file__(digest, snapshot)
+
+        _snapshot = snapshot
+        _fingerprint = fingerprint
+        return _snapshot
+
+
+def __fingerprint__():
+    fingerprint = []
+    for ini, path in INI_FILES.items():
+        try:
+            stat = os.stat(path)
+            fingerprint.append([ini, stat.st_size, stat.st_mtime, stat.st_ino, stat.st_ctime])
+        except OSError:
+            fingerprint.append([ini, None, None, None, None])
+    return fingerprint
+
+
+def __digest__():
+    """
+    SHA-1 of every ini file, catching rewrites that keep the size and land within one mtime tick
+    """
+    digest = []
+    for ini, path in INI_FILES.items():
+        try:
+            with open(path, 'rb') as ini_file:
+                digest.append([ini, hashlib.sha1(ini_file.read()).hexdigest()])
+        except IOError:
+            digest.append([ini, None])
+    return digest
+
+
+def __new_parser__():
+    try:  # Python 2
+        return configparser.SafeConfigParser()
+    except AttributeError:  # Python 3
+        return configparser.ConfigParser()
+
+
+def __parse_ini__(path):
+    """
+    :return: (interpolated sections, raw sections) of path
+    """
+    parser = __new_parser__()
+    sections = OrderedDict()
+    raw_sections = OrderedDict()
+    try:
+        parser.read(path)
+        for section in parser.sections():
+            raw_sections[section] = OrderedDict(parser.items(section, raw=True))
+            sections[section] = OrderedDict(parser.items(section))
+    except configparser.Error as e:
+        Logger.app.error("Error reading {} {}".format(path, e))
+    return sections, raw_sections
+
+
+def __read_snapshot_file__(fingerprint):
+    if not os.path.isfile(SNAPSHOT_FILE):
+        return None
+    try:
+        with open(SNAPSHOT_FILE, 'r') as snapshot_file:
+            compiled = json.load(snapshot_file, object_pairs_hook=OrderedDict)
+        if compiled.get('fingerprint') == fingerprint:
+            return {'config': compiled['config'], 'raw': compiled['raw']}
+    except (IOError, ValueError, KeyError) as e:
+        Logger.app.debug("Ignoring unreadable config snapshot {}: {}".format(SNAPSHOT_FILE, e))
+    return None
+
+
+def __write_snapshot_file__(fingerprint, snapshot):
+    temp_file = "{}.{}".format(SNAPSHOT_FILE, os.getpid())
+    try:
+        with open(temp_file, 'w') as snapshot_file:
+            json.dump({'fingerprint': fingerprint, 'config': snapshot['config'], 'raw': snapshot['raw']},
+                      snapshot_file)
+        # The snapshot holds the same (still encrypted) values as the ini files, keep it private
+        os.chmod(temp_file, 0o600)
+        os.rename(temp_file, SNAPSHOT_FILE)
+    except (IOError, OSError) as e:
+        Logger.app.debug("Unable to write config snapshot {}: {}".format(SNAPSHOT_FILE, e))
@@ -2,7 +2,29 @@
 # -*- coding: utf-8 -*-
 
 import os
+from contextlib import contextmanager
 from webbreaker.webbreakerlogger import Logger
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive advisory lock on lock_path for the duration of the context, so concurrent WebBreaker
+    processes on one host serialize access to shared files. Platforms without fcntl are not locked.
+    """
+    with open(lock_path, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 
 class WebBreakerHelper(object):
     @classmethod
@@ -1,17 +1,37 @@
 #!/usr/bin/env python
 # -*-coding:utf-8-*-
 
-import logging.config
 import logging
+import logging.handlers
+import atexit
+import copy
 import datetime
+import errno
+import json
+import re
 import sys
 import os
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 
 FORMATTER = logging.Formatter('%(message)s')
-DATETIME_SUFFIX = datetime.datetime.now().strftime("%m-%d-%Y-%H%M%S")
-APP_LOG = os.path.abspath(os.path.join('/tmp/', 'webbreaker-' + DATETIME_SUFFIX + '.log'))
-DEBUG_LOG = os.path.abspath(os.path.join('/tmp/', 'webbreaker-debug-' + DATETIME_SUFFIX + '.log'))
-STOUT_LOG = os.path.abspath(os.path.join('/tmp', 'webbreaker-out' + DATETIME_SUFFIX + '.log'))
+LOG_DIR = os.getenv('WEBBREAKER_LOG_DIR', '/tmp/')
+# RotatingFileHandler is not safe across processes, so each process logs to its own files
+LOG_SUFFIX = "{0}-{1}".format(datetime.datetime.now().strftime("%m-%d-%Y-%H%M%S"), os.getpid())
+APP_LOG = os.path.abspath(os.path.join(LOG_DIR, 'webbreaker-' + LOG_SUFFIX + '.log'))
+DEBUG_LOG = os.path.abspath(os.path.join(LOG_DIR, 'webbreaker-debug-' + LOG_SUFFIX + '.log'))
+STOUT_LOG = os.path.abspath(os.path.join(LOG_DIR, 'webbreaker-out-' + LOG_SUFFIX + '.log'))
+# Rotate log files at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT rotated files
+LOG_MAX_BYTES = int(os.getenv('WEBBREAKER_LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('WEBBREAKER_LOG_BACKUP_COUNT', 5))
+# Log files of finished processes are pruned at startup past the newest LOG_KEEP runs or LOG_MAX_AGE days
+LOG_KEEP = int(os.getenv('WEBBREAKER_LOG_KEEP', 20))
+LOG_MAX_AGE = float(os.getenv('WEBBREAKER_LOG_MAX_AGE', 7))
+LOG_FILE_PATTERN = re.compile(r'^webbreaker-(?:debug-|out-)?(\d{2}-\d{2}-\d{4}-\d{6})(?:-(\d+))?\.log(?:\.\d+)?$')
+# Debug records are only logged when WEBBREAKER_DEBUG is set, others are dropped before they are rendered
+LOG_LEVEL = logging.DEBUG if os.getenv('WEBBREAKER_DEBUG', '').lower() in ('1', 'true', 'yes') else logging.INFO
 
 
 def singleton(cls):
@@ -23,10 +43,132 @@ def singleton(cls):
         return instances[cls]
     return get_instance()
 
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON document per log record
+    """
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'logger': record.name,
+            'level': record.levelname,
+            'pid': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LazyJson(object):
+    """
+    Defers json.dumps of a (possibly large) object until a log record is handled, so nothing is serialized for
+    records filtered out by level. Pass it as a %-style logging argument,
+    e.g. Logger.app.debug("Response: %s", LazyJson(response)).
+    """
+    def __init__(self, obj, **kwargs):
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return json.dumps(self.obj, default=lambda o: o.__dict__, **self.kwargs)
+
+
+if hasattr(logging.handlers, 'QueueHandler'):
+    class DeferredQueueHandler(logging.handlers.QueueHandler):
+        """
+        QueueHandler that hands records to the listener thread without the JSON formatting. The message itself is
+        rendered on the calling thread, so arguments changed after the call can't alter what is logged.
+        """
+        def prepare(self, record):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+else:  # Python 2
+    DeferredQueueHandler = None
+
+
+def get_file_handler(log_file, name):
+    handler = logging.handlers.RotatingFileHandler(log_file, mode='a', maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUP_COUNT, delay=True)
+    handler.setFormatter(JsonLinesFormatter())
+    handler.setLevel(logging.DEBUG)
+    # Both file handlers share one listener, only take records from our own logger
+    handler.addFilter(logging.Filter(name))
+    return handler
+
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def prune_log_files(log_dir=LOG_DIR, keep=LOG_KEEP, max_age=LOG_MAX_AGE):
+    """
+    Remove the log files of earlier runs, keeping the newest keep runs younger than max_age days. Files of
+    processes still running are never removed.
+    """
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return
+    runs = {}
+    for name in names:
+        match = LOG_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        path = os.path.join(log_dir, name)
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            continue
+        files, newest = runs.get(match.groups(), ([], 0))
+        files.append(path)
+        runs[match.groups()] = (files, max(newest, modified))
+
+    oldest = datetime.datetime.now() - datetime.timedelta(days=max_age)
+    ordered = sorted(runs.items(), key=lambda run: run[1][1], reverse=True)
+    for index, ((started, pid), (files, newest)) in enumerate(ordered):
+        if pid and (int(pid) == os.getpid() or process_running(int(pid))):
+            continue
+        if index < keep and datetime.datetime.fromtimestamp(newest) > oldest:
+            continue
+        for path in files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def start_file_logging(handlers):
+    """
+    Route all file logging through a queue drained by a single background listener, so writing log files never
+    blocks the caller. Falls back to writing directly where QueueHandler is unavailable.
+    :return: dict of logger name to the handler that logger should use
+    """
+    if not DeferredQueueHandler:
+        return dict((name, handler) for name, handler in handlers)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *[handler for name, handler in handlers],
+                                              respect_handler_level=True)
+    listener.start()
+    # Drain anything still queued when the process exits
+    atexit.register(listener.stop)
+    queue_handler = DeferredQueueHandler(log_queue)
+    return dict((name, queue_handler) for name, handler in handlers)
+
+
 def get_console_logger():
     try:
         console_logger = logging.getLogger()
-        console_logger.setLevel(logging.NOTSET)
+        console_logger.setLevel(LOG_LEVEL)
         #console_logger.propagate = False
         #if there are two console_logger use only one.
         if console_logger.handlers:
@@ -48,43 +190,18 @@ def get_console_logger():
     return console_logger
 
 
-def get_app_logger(name=None):
+def get_file_logger(name, handler):
     try:
-        logger_map = {"__webbreaker__": APP_LOG}
-        app_logger = logging.getLogger("__webbreaker__")
-        app_logger.setLevel(logging.NOTSET)
-        # if there are two app_loggers use only one.
-        if app_logger.handlers:
-            app_logger.handlers.pop()
-    
-        formatter = logging.Formatter('%(asctime)s: %(name)s %(levelname)s(%(message)s')
-        fh = logging.FileHandler(logger_map[name], mode='a')
-        fh.setFormatter(formatter)
-        fh.setLevel(logging.DEBUG)
-        app_logger.addHandler(fh)
+        file_logger = logging.getLogger(name)
+        file_logger.setLevel(LOG_LEVEL)
+        # if there are two file loggers use only one.
+        if file_logger.handlers:
+            file_logger.handlers.pop()
+        file_logger.addHandler(handler)
     except TypeError as e:
-        sys.stdout.write(str("App logger error: {}!\n".format(e)))
-    
-    return app_logger
+        sys.stdout.write(str("Logger {} error: {}!\n".format(name, e)))
 
-
-def get_debug_logger(name=None):
-    try:
-        debug_logger = logging.getLogger(name)
-        debug_logger.setLevel(logging.NOTSET)
-        # if there are two debug_logger use only one.
-        if debug_logger.handlers:
-            debug_logger.handlers.pop()
-    
-        debug_formatter = logging.Formatter('%(asctime)s: %(name)s %(levelname)s(%(message)s')
-        fh = logging.FileHandler(DEBUG_LOG, mode='a')
-        fh.setFormatter(debug_formatter)
-        fh.setLevel(logging.DEBUG)
-        debug_logger.addHandler(fh)
-    except TypeError as e:
-        sys.stdout.write(str("Debug logger error: {}!\n".format(e)))
-    
-    return debug_logger
+    return file_logger
 
 
 # Override existing hierarchical filter logic in logger
@@ -99,9 +216,11 @@ class LessThanFilter(logging.Filter):
 @singleton
 class Logger():
     def __init__(self):
-        self.app = get_app_logger("__webbreaker__")
-        self.debug = get_debug_logger("__webbreaker_debug__")
+        prune_log_files()
+        handlers = start_file_logging([("__webbreaker__", get_file_handler(APP_LOG, "__webbreaker__")),
+                                       ("__webbreaker_debug__", get_file_handler(DEBUG_LOG, "__webbreaker_debug__"))])
+        self.app = get_file_logger("__webbreaker__", handlers["__webbreaker__"])
+        self.debug = get_file_logger("__webbreaker_debug__", handlers["__webbreaker_debug__"])
         self.console = get_console_logger()
         self.app_logfile = APP_LOG
         self.app_debug = DEBUG_LOG
-
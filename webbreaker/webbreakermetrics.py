@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:  # Python3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+from webbreaker.webbreakerconfigloader import load_config
+from webbreaker.webbreakerlogger import Logger
+
+# Latency buckets (seconds) for API requests and agent poll cycles
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Duration buckets (seconds) for scan phases, which take minutes to hours
+PHASE_BUCKETS = (10, 60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400)
+# Seconds between rewrites of the textfile collector file
+TEXTFILE_INTERVAL = 15
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_exporters = []
+_exporters_lock = threading.Lock()
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: Every registered metric in the Prometheus text exposition format
+        """
+        with self.lock:
+            metrics = list(self.metrics)
+        return ''.join(metric.render() for metric in metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Metric(object):
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.documentation),
+                 "# TYPE {} {}".format(self.name, self.type_name)]
+        with self.lock:
+            for key in sorted(self.values):
+                lines.extend(self.__samples__(key, self.values[key]))
+        return '\n'.join(lines) + '\n'
+
+    def __key__(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("{} takes the labels {}".format(self.name, ', '.join(self.labels)))
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def __samples__(self, key, value):
+        return ["{}{} {}".format(self.name, format_labels(self.labels, key), format_value(value))]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.__key__(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        Metric.__init__(self, name, documentation, labels=labels, registry=registry)
+
+    def observe(self, value, **labels):
+        key = self.__key__(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - started, **labels)
+
+    def __samples__(self, key, value):
+        counts, total = value
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append("{}_bucket{} {}".format(self.name, format_labels(self.labels + ('le',),
+                                                                            key + (format_value(bound),)),
+                                                   cumulative))
+        samples.append("{}_sum{} {}".format(self.name, format_labels(self.labels, key), format_value(total)))
+        samples.append("{}_count{} {}".format(self.name, format_labels(self.labels, key), cumulative))
+        return samples
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('\n', '\\n')
+                                           .replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+API_REQUESTS = Counter('webbreaker_api_requests_total', 'Requests sent to SSC and WebInspect by result.',
+                       labels=('backend', 'result'))
+API_LATENCY = Histogram('webbreaker_api_request_seconds', 'Latency of requests sent to SSC and WebInspect.',
+                        labels=('backend',))
+POLL_CYCLES = Counter('webbreaker_agent_poll_cycles_total', 'Cloudscan job lookups and status checks made by the '
+                                                            'agent.', labels=('action',))
+POLL_LATENCY = Histogram('webbreaker_agent_poll_seconds', 'Duration of agent cloudscan job lookups and status checks.',
+                         labels=('action',))
+AGENT_JOBS = Gauge('webbreaker_agent_jobs', 'Cloudscan jobs watched by the agent by last seen state.',
+                   labels=('state',))
+AGENT_JOBS_FINISHED = Counter('webbreaker_agent_jobs_finished_total', 'Cloudscan watches ended by final state.',
+                              labels=('state',))
+NOTIFICATIONS = Counter('webbreaker_notifications_total', 'Notifications sent by notifier and result.',
+                        labels=('notifier', 'result'))
+SCANS_RUNNING = Gauge('webbreaker_webinspect_scans_running', 'WebInspect scans this process is waiting on.')
+SCAN_PHASE = Histogram('webbreaker_scan_phase_seconds', 'Duration of WebInspect scan phases.', labels=('phase',),
+                       buckets=PHASE_BUCKETS)
+
+
+def record_api_request(backend, seconds, response_code):
+    """
+    :param response_code: HTTP status of the response, anything else when no response was received
+    """
+    try:
+        result = "{}xx".format(int(response_code) // 100) if int(response_code) > 0 else 'error'
+    except (TypeError, ValueError):
+        result = 'error'
+    API_REQUESTS.inc(backend=backend, result=result)
+    API_LATENCY.observe(seconds, backend=backend)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, registry=REGISTRY):
+        HTTPServer.__init__(self, address, MetricsHandler)
+        self.registry = registry
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TextfileExporter(object):
+    """
+    Rewrites path with the registry every interval seconds and at exit, for the node_exporter textfile collector.
+    The file is replaced atomically so the collector never reads a partial write.
+    """
+    def __init__(self, path, interval=TEXTFILE_INTERVAL, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self.__write_periodically__, name='MetricsTextfile')
+        self.writer.daemon = True
+        self.writer.start()
+        atexit.register(self.close)
+
+    def write(self):
+        temp_file = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(temp_file, 'w') as prom_file:
+                prom_file.write(self.registry.render())
+            os.rename(temp_file, self.path)
+        except (IOError, OSError) as e:
+            Logger.app.debug("Unable to write metrics to {}: {}".format(self.path, e))
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.write()
+
+    def __write_periodically__(self):
+        while not self.closed.wait(self.interval):
+            self.write()
+
+
+def start_metrics(job, serve=False):
+    """
+    Export metrics as set in the [metrics] section of webbreaker.ini: into <metrics_textfile_dir>/webbreaker_<job>.prom
+    and, when serve is set, on metrics_host:metrics_port. Nothing is exported while both are unset.
+    :param job: Name of this process in the textfile, e.g. agent or scan
+    :param serve: Serve the metrics over HTTP, only done by long running processes such as the agent
+    :return: The MetricsServer, or None
+    """
+    server = None
+    try:
+        config = load_config('webbreaker')
+    except Exception as e:
+        Logger.app.debug("Metrics are not exported: {}".format(e))
+        return None
+    textfile_dir = __option__(config, 'metrics_textfile_dir')
+    if textfile_dir:
+        exporter = TextfileExporter(os.path.join(textfile_dir, "webbreaker_{}.prom".format(job)))
+        with _exporters_lock:
+            _exporters.append(exporter)
+    port = __option__(config, 'metrics_port')
+    if serve and port:
+        host = __option__(config, 'metrics_host') or '127.0.0.1'
+        try:
+            server = MetricsServer((host, int(port)))
+        except (ValueError, IOError, OSError) as e:
+            Logger.app.error("Unable to serve metrics on {}:{}: {}".format(host, port, e))
+            return None
+        thread = threading.Thread(target=server.serve_forever, name='MetricsServer')
+        thread.daemon = True
+        thread.start()
+        Logger.app.info("Serving metrics on {}:{}".format(host, port))
+    return server
+
+
+def flush_metrics():
+    """
+    Write every textfile now, for processes about to exit without running atexit handlers.
+    """
+    with _exporters_lock:
+        exporters = list(_exporters)
+    for exporter in exporters:
+        exporter.write()
+
+
+def __option__(config, option):
+    if config.has_option('metrics', option):
+        return config.get('metrics', option)
+    return None
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import webinspectapi.webinspect as webinspectapi
+from webbreaker.webbreakermetrics import record_api_request
+
+
+class WebInspectApi(webinspectapi.WebInspectApi):
+    """
+    WebInspectApi recording the latency and result of every request in the WebBreaker metrics.
+    """
+    def _request(self, *args, **kwargs):
+        started = time.time()
+        response = None
+        try:
+            response = webinspectapi.WebInspectApi._request(self, *args, **kwargs)
+            return response
+        finally:
+            record_api_request('webinspect', time.time() - started, getattr(response, 'response_code', None))
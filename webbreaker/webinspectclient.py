@@ -5,8 +5,8 @@ import sys
 import json
 import ntpath
 import requests
-import webinspectapi.webinspect as webinspectapi
-from webbreaker.webbreakerlogger import Logger
+from webbreaker.webinspectapiclient import WebInspectApi
+from webbreaker.webbreakerlogger import Logger, LazyJson
 from webbreaker.webbreakerhelper import WebBreakerHelper
 from webbreaker.webinspectconfig import WebInspectConfig
 from webbreaker.webinspectjitscheduler import WebInspectJitScheduler
@@ -16,11 +16,12 @@ requests.packages.urllib3.disable_warnings()
 
 
 class WebinspectClient(object):
-    def __init__(self, webinspect_setting, endpoint=None):
+    def __init__(self, webinspect_setting, endpoint=None, config=None):
 
         # Select an appropriate endpoint if none was provided.
         if not endpoint:
-            config = WebInspectConfig()
+            if not config:
+                config = WebInspectConfig()
             lb = WebInspectJitScheduler(endpoints=config.endpoints, size_list=config.sizing,
                                         size_needed=webinspect_setting['webinspect_scan_size'])
             endpoint = lb.get_endpoint()
@@ -43,6 +44,8 @@ class WebinspectClient(object):
         self.allowed_hosts = webinspect_setting['webinspect_allowed_hosts']
         self.scan_size = webinspect_setting['webinspect_scan_size']
         self.runenv = WebBreakerHelper.check_run_env()
+        # Name the scan was created with, which under Jenkins is BUILD_TAG rather than scan_name
+        self.launched_scan_name = None
 
         Logger.console.debug("url: {}".format(self.url))
         Logger.console.debug("settings: {}".format(self.settings))
@@ -61,7 +64,7 @@ class WebinspectClient(object):
 
     def __settings_exists__(self):
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.list_settings()
 
             if response.success:
@@ -80,28 +83,29 @@ class WebinspectClient(object):
         Launches and monitors a scan
         :return: If scan was able to launch, scan_id. Otherwise none.
         """
-        overrides = json.dumps(webinspectjson.formatted_settings_payload(self.settings, self.scan_name, self.runenv,
-                                                                         self.scan_mode, self.scan_scope,
-                                                                         self.login_macro,
-                                                                         self.scan_policy, self.scan_start,
-                                                                         self.start_urls, self.workflow_macros,
-                                                                         self.allowed_hosts))
-
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        payload = webinspectjson.formatted_settings_payload(self.settings, self.scan_name, self.runenv,
+                                                            self.scan_mode, self.scan_scope, self.login_macro,
+                                                            self.scan_policy, self.scan_start, self.start_urls,
+                                                            self.workflow_macros, self.allowed_hosts)
+        self.launched_scan_name = payload['overrides']['scanName']
+        overrides = json.dumps(payload)
+
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.create_scan(overrides)
 
-        logger_response = json.dumps(response, default=lambda o: o.__dict__, sort_keys=True)
+        # Only serialized if and when the record is written
+        logger_response = LazyJson(response, sort_keys=True)
         Logger.console.info("Request sent to WebInspect server: {}".format(self.url))
-        Logger.app.debug("Request sent to {0}:\n{1}".format(self.url, overrides))
-        Logger.app.debug("Response from {0}:\n{1}".format(self.url, logger_response))
+        Logger.app.debug("Request sent to %s:\n%s", self.url, overrides)
+        Logger.app.debug("Response from %s:\n%s", self.url, logger_response)
 
         if response.success:
             scan_id = response.data['ScanId']
             sys.stdout.write(str('WebInspect scan launched on {0} your scan id: {1} !!\n'.format(self.url, scan_id)))
         else:
             sys.stdout.write(str("No scan was launched! {}".format(response.message)))
-            Logger.app.error("Request sent to {0}:\n{1}".format(self.url, overrides))
-            Logger.app.info("Response from {0}:\n{1}".format(self.url, logger_response))
+            Logger.app.error("Request sent to %s:\n%s", self.url, overrides)
+            Logger.app.info("Response from %s:\n%s", self.url, logger_response)
             return False
 
         return scan_id
@@ -115,7 +119,7 @@ class WebinspectClient(object):
         # Export scan as a xml for Threadfix or other Vuln Management System
         Logger.console.debug('Exporting scan: {} as {}'.format(scan_id, extension))
         detail_type = 'Full' if extension == 'xml' else None
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.export_scan_format(scan_id, extension, detail_type)
 
         if response.success:
@@ -129,7 +133,7 @@ class WebinspectClient(object):
             Logger.app.error('Unable to retrieve scan results. {} '.format(response.message))
 
     def get_policy_by_guid(self, policy_guid):
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.get_policy_by_guid(policy_guid)
         if response.success:
             return response.data
@@ -137,7 +141,7 @@ class WebinspectClient(object):
             return None
 
     def get_policy_by_name(self, policy_name):
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.get_policy_by_name(policy_name)
         if response.success:
             return response.data
@@ -148,7 +152,7 @@ class WebinspectClient(object):
         try:
 
             if scan_name:
-                api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+                api = WebInspectApi(self.url, verify_ssl=False)
                 response = api.get_scan_by_name(scan_name)
                 if response.success:
                     scan_guid = response.data[0]['ID']
@@ -156,7 +160,7 @@ class WebinspectClient(object):
                     Logger.app.error(response.message)
                     return None
 
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.get_scan_issues(scan_guid)
             if response.success:
                 return response.data_json(pretty=pretty)
@@ -169,7 +173,7 @@ class WebinspectClient(object):
         try:
 
             if scan_name:
-                api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+                api = WebInspectApi(self.url, verify_ssl=False)
                 response = api.get_scan_by_name(scan_name)
                 if response.success:
                     scan_guid = response.data[0]['ID']
@@ -177,7 +181,7 @@ class WebinspectClient(object):
                     Logger.app.error(response.message)
                     return None
 
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.get_scan_log(scan_guid)
             if response.success:
                 return response.data_json()
@@ -187,18 +191,19 @@ class WebinspectClient(object):
             Logger.app.error("get_scan_log failed: {}".format(e))
 
     def get_scan_status(self, scan_guid):
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        # A single scan is looked up directly, listing every scan on the endpoint is only worth it when many
+        # are polled at once (see WebInspectStatusService)
+        api = WebInspectApi(self.url, verify_ssl=False)
         try:
             response = api.get_current_status(scan_guid)
-            status = json.loads(response.data_json())['ScanStatus']
-            return status
-        except (ValueError, UnboundLocalError, TypeError) as e:
+            return response.data['ScanStatus']
+        except (ValueError, UnboundLocalError, TypeError, KeyError) as e:
             Logger.app.error("get_scan_status failed: {}".format(e))
             return "Unknown"
 
     def list_policies(self):
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.list_policies()
 
             if response.success:
@@ -213,7 +218,7 @@ class WebinspectClient(object):
     def list_scans(self):
 
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.list_scans()
 
             if response.success:
@@ -227,7 +232,7 @@ class WebinspectClient(object):
 
     def list_webmacros(self):
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.list_webmacros()
 
             if response.success:
@@ -241,24 +246,24 @@ class WebinspectClient(object):
 
     def policy_exists(self, policy_guid):
         # true if policy exists
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.get_policy_by_guid(policy_guid)
         return response.success
 
     def stop_scan(self, scan_guid):
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.stop_scan(scan_guid)
         return response.success
 
     def upload_policy(self):
         # if a policy of the same name already exists, delete it prior to upload
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             # bit of ugliness here. I'd like to just have the policy name at this point but I don't
             # so find it in the full path
             response = api.get_policy_by_name(ntpath.basename(self.webinspect_upload_policy).split('.')[0])
             if response.success and response.response_code == 200:  # the policy exists on the server already
-                api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+                api = WebInspectApi(self.url, verify_ssl=False)
                 response = api.delete_policy(response.data['uniqueId'])
                 if response.success:
                     Logger.console.debug("Deleted policy {} from server".format(ntpath.basename(self.webinspect_upload_policy).split('.')[0]))
@@ -266,7 +271,7 @@ class WebinspectClient(object):
             Logger.app.error("Verify if deletion of existing policy failed: {}".format(e))
 
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.upload_policy(self.webinspect_upload_policy)
 
             if response.success:
@@ -281,7 +286,7 @@ class WebinspectClient(object):
     def upload_settings(self):
 
         try:
-            api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+            api = WebInspectApi(self.url, verify_ssl=False)
             response = api.upload_settings(self.webinspect_upload_settings)
 
             if response.success:
@@ -296,7 +301,7 @@ class WebinspectClient(object):
     def upload_webmacros(self):
         try:
             for webmacro in self.webinspect_upload_webmacros:
-                api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+                api = WebInspectApi(self.url, verify_ssl=False)
                 response = api.upload_webmacro(webmacro)
                 if response.success:
                     Logger.console.debug("Uploaded webmacro {} to server.".format(webmacro))
@@ -313,7 +318,7 @@ class WebinspectClient(object):
         :return:
         """
         # WebInspect Scan has started, wait here until it's done
-        api = webinspectapi.WebInspectApi(self.url, verify_ssl=False)
+        api = WebInspectApi(self.url, verify_ssl=False)
         response = api.wait_for_status_change(scan_id)  # this line is the blocker
 
         if response.success:
@@ -6,23 +6,29 @@ try:
 except ImportError: #Python3
     import configparser
 import argparse
+import json
 import os, sys
 import random
 import string
 import re
+import time
 import xml.etree.ElementTree as ET
 from subprocess import CalledProcessError, check_output
 from webbreaker.webbreakerlogger import Logger
-from webbreaker.webbreakerhelper import WebBreakerHelper
+from webbreaker.webbreakerconfigloader import load_config
+from webbreaker.webbreakerhelper import WebBreakerHelper, file_lock
 
 runenv = WebBreakerHelper.check_run_env()
 
+SETTINGS_NAMESPACE = '{http://spidynamics.com/schemas/scanner/1.0}'
+SCAN_TARGETS_PATH = [SETTINGS_NAMESPACE + tag for tag in
+                     ['HostFolderRules', 'List', 'HostFolderRuleData', 'HostMatch', 'List', 'LookupList', 'string']]
+SCAN_TARGETS_CACHE = os.path.abspath(os.path.join('webbreaker', 'etc', '.scan_targets_cache.json'))
+scan_targets_cache = None
+
+DEFAULT_REPO_REFRESH_TTL = 3600
+REPO_REFRESH_STAMP = 'webbreaker_refresh'
 
-# TODO: Test on Python2
-try:  # Python 2
-    config = configparser.SafeConfigParser()
-except NameError:  # Python 3
-    config = configparser.ConfigParser()
 
 
 class WebInspectEndpoint(object):
@@ -46,6 +52,10 @@ class WebInspectConfig(object):
             self.default_size = webinspect_dict['default_size']
             self.webinspect_git = webinspect_dict['git']
             self.webinspect_dir = webinspect_dict['dir']
+            self.webinspect_git_ttl = webinspect_dict['refresh_ttl']
+            self.webinspect_git_revision = webinspect_dict['revision']
+            self.webinspect_git_depth = webinspect_dict['depth']
+            self.webinspect_git_sparse_paths = webinspect_dict['sparse_paths']
             self.mapped_policies = webinspect_dict['mapped_policies']
         except KeyError as e:
             Logger.console.error("Your configurations file or scan setting is incorrect see log: {}!!!".format(Logger.app_logfile))
@@ -56,9 +66,10 @@ class WebInspectConfig(object):
         webinspect_setting = os.path.abspath(os.path.join('webbreaker', 'etc', 'webinspect.ini'))
 
         try:
-            config.read(webinspect_setting)
+            config = load_config('webinspect')
             webinspect_dict['git'] = config.get("configuration_repo", "git")
             webinspect_dict['dir'] = config.get("configuration_repo", "dir")
+            webinspect_dict.update(self.__get_repo_settings__(config, webinspect_setting))
             webinspect_dict['default_size'] = config.get("webinspect_default_size", "default")
             webinspect_dict['mapped_policies'] = [[option, config.get('webinspect_policies', option)] for option in
                                                   config.options('webinspect_policies')]
@@ -79,30 +90,115 @@ class WebInspectConfig(object):
 
         return webinspect_dict
 
+    def __get_repo_settings__(self, config, webinspect_setting):
+        """
+        Optional [configuration_repo] settings. Each is parsed before any is returned, so an invalid value falls
+        back to its default instead of leaving the rest unset.
+        """
+        refresh_ttl = self.__get_repo_option__(config, 'refresh_ttl', DEFAULT_REPO_REFRESH_TTL)
+        try:
+            refresh_ttl = int(refresh_ttl)
+        except ValueError as e:
+            Logger.app.error("{} has an incorrect refresh_ttl, using {}: {}".format(webinspect_setting,
+                                                                                   DEFAULT_REPO_REFRESH_TTL, e))
+            refresh_ttl = DEFAULT_REPO_REFRESH_TTL
+        depth = self.__get_repo_option__(config, 'depth')
+        try:
+            depth = int(depth) if depth else None
+        except ValueError as e:
+            Logger.app.error("{} has an incorrect depth, cloning the full history: {}".format(webinspect_setting, e))
+            depth = None
+        sparse_paths = [path.strip() for path in self.__get_repo_option__(config, 'sparse_paths', '').split(',')
+                        if path.strip()]
+        return {'refresh_ttl': refresh_ttl, 'revision': self.__get_repo_option__(config, 'revision'),
+                'depth': depth, 'sparse_paths': sparse_paths}
+
+    @staticmethod
+    def __get_repo_option__(config, option, default=None):
+        """
+        Optional [configuration_repo] settings, empty values fall back to default
+        """
+        if config.has_option("configuration_repo", option) and config.get("configuration_repo", option).strip():
+            return config.get("configuration_repo", option).strip()
+        return default
+
     def __getScanTargets__(self, settings_file_path):
         """
         Given a settings file at the provided path, return a set containing
-        the targets for the scan.
+        the targets for the scan. Results are cached by path, size and mtime, in process and in
+        SCAN_TARGETS_CACHE, so repeated scans with unchanged settings skip parsing entirely.
         :param settings_file_path: Path to WebInspect settings file
         :return: unordered set of targets
         """
-        targets = set()
         try:
-            tree = ET.parse(settings_file_path)
-            root = tree.getroot()
-            for target in root.findall("xmlns:HostFolderRules/"
-                                       "xmlns:List/"
-                                       "xmlns:HostFolderRuleData/"
-                                       "xmlns:HostMatch/"
-                                       "xmlns:List/"
-                                       "xmlns:LookupList/"
-                                       "xmlns:string", namespaces={'xmlns': 'http://spidynamics.com/schemas/scanner/1.0'}):
-                targets.add(target.text)
+            path = os.path.abspath(settings_file_path)
+            stat = os.stat(path)
+            fingerprint = [stat.st_size, stat.st_mtime]
+        except OSError as e:
+            Logger.app.error("Unable to read the WebInspect settings file {0}".format(e))
+            return set()
+
+        cache = self.__load_scan_targets_cache__()
+        cached = cache.get(path)
+        if cached and cached['fingerprint'] == fingerprint:
+            return set(cached['targets'])
+
+        try:
+            targets = self.__parse_scan_targets__(path)
         except Exception as e:
             Logger.app.error("Unable to read the WebInspect settings file {0}".format(e))
+            return set()
 
+        cache[path] = {'fingerprint': fingerprint, 'targets': sorted(targets)}
+        self.__save_scan_targets_cache__(cache)
+        return targets
+
+    @staticmethod
+    def __parse_scan_targets__(settings_file_path):
+        """
+        Incrementally parse the settings file, collecting the HostMatch targets and stopping as soon as the
+        HostFolderRules element has been read instead of building the whole tree.
+        """
+        targets = set()
+        path = []
+        for event, element in ET.iterparse(settings_file_path, events=('start', 'end')):
+            if event == 'start':
+                path.append(element.tag)
+                continue
+            # path[0] is the document root, targets are matched relative to it
+            if path[1:] == SCAN_TARGETS_PATH:
+                targets.add(element.text)
+            path.pop()
+            if len(path) == 1 and element.tag == SCAN_TARGETS_PATH[0]:
+                break
+            if len(path) > 1:
+                # parent elements are still being built, but finished children are no longer needed
+                element.clear()
         return targets
 
+    @staticmethod
+    def __load_scan_targets_cache__():
+        global scan_targets_cache
+        if scan_targets_cache is None:
+            scan_targets_cache = {}
+            if os.path.isfile(SCAN_TARGETS_CACHE):
+                try:
+                    with open(SCAN_TARGETS_CACHE, 'r') as cache_file:
+                        scan_targets_cache = json.load(cache_file)
+                except (IOError, ValueError) as e:
+                    Logger.app.debug("Ignoring unreadable scan targets cache {0}: {1}".format(SCAN_TARGETS_CACHE, e))
+        return scan_targets_cache
+
+    @staticmethod
+    def __save_scan_targets_cache__(cache):
+        temp_file = "{0}.{1}".format(SCAN_TARGETS_CACHE, os.getpid())
+        try:
+            with open(temp_file, 'w') as cache_file:
+                json.dump(cache, cache_file)
+            os.rename(temp_file, SCAN_TARGETS_CACHE)
+        except (IOError, OSError) as e:
+            Logger.app.debug("Unable to write scan targets cache {0}: {1}".format(SCAN_TARGETS_CACHE, e))
+
     def parse_webinspect_options(self, options):
         webinspect_dict = {}
 
@@ -236,25 +332,107 @@ class WebInspectConfig(object):
 
     # TODO: Move to the WebInspectHelper class
     def fetch_webinspect_configs(self):
+        """
+        Clone or refresh the WebInspect configuration repo. Refreshes are skipped while the checkout is younger
+        than refresh_ttl seconds, or while it is already at a pinned commit, and are serialized across processes
+        with a lock file so parallel jobs on one agent don't corrupt each other's checkout.
+        """
         full_path = os.path.join(os.path.dirname(__file__), self.webinspect_dir)
         git_dir = os.path.abspath(os.path.join(full_path, '.git'))
-        
+
         try:
-            if not os.path.isdir(full_path):
-                #Logger.console.info(
-                #    "Fetching the WebInspect configurations from {}\n".format(full_path))
-                check_output(['git', 'clone', self.webinspect_git, full_path])
-
-            elif os.path.isdir(git_dir):
-                Logger.console.info(
-                    "Updating your WebInspect configurations from {}".format(full_path))
-                check_output(['git','init', full_path])
-                check_output(['git', '--git-dir=' + git_dir, 'reset', '--hard'])
-                call(['git', '--git-dir=' + git_dir, 'pull', '--rebase'])
-                sys.stdout.flush()
-            else:
-                Logger.app.error(
-                    "No GIT Repo was declared in your webinspect.ini, therefore nothing will be cloned!")
-                
-        except (CalledProcessError, AttributeError) as e:
-            Logger.app.error("Uh oh something is wrong with your WebInspect configurations!!".format(e))
+            parent_dir = os.path.dirname(os.path.abspath(full_path))
+            if not os.path.isdir(parent_dir):
+                os.makedirs(parent_dir)
+            with file_lock(os.path.abspath(full_path).rstrip(os.sep) + '.lock'):
+                if not os.path.isdir(full_path):
+                    self.__clone_webinspect_configs__(full_path)
+
+                elif os.path.isdir(git_dir):
+                    if self.__webinspect_configs_current__(full_path, git_dir):
+                        Logger.app.debug("WebInspect configurations in {} are current, skipping refresh".format(
+                            full_path))
+                        return
+                    Logger.console.info(
+                        "Updating your WebInspect configurations from {}".format(full_path))
+                    self.__refresh_webinspect_configs__(full_path)
+                    sys.stdout.flush()
+                else:
+                    Logger.app.error(
+                        "No GIT Repo was declared in your webinspect.ini, therefore nothing will be cloned!")
+                    return
+
+                self.__touch_refresh_stamp__(git_dir)
+
+        except (CalledProcessError, AttributeError, OSError, IOError) as e:
+            Logger.app.error("Uh oh something is wrong with your WebInspect configurations!! {}".format(e))
+
+    def __clone_webinspect_configs__(self, full_path):
+        clone = ['git', 'clone']
+        if self.webinspect_git_depth:
+            clone.extend(['--depth', str(self.webinspect_git_depth)])
+        if self.webinspect_git_sparse_paths:
+            clone.append('--no-checkout')
+        check_output(clone + [self.webinspect_git, full_path])
+
+        if self.webinspect_git_revision:
+            self.__refresh_webinspect_configs__(full_path)
+        elif self.webinspect_git_sparse_paths:
+            self.__apply_sparse_checkout__(full_path)
+            check_output(['git', '-C', full_path, 'checkout'])
+
+    def __refresh_webinspect_configs__(self, full_path):
+        sparse = self.__apply_sparse_checkout__(full_path)
+        depth = ['--depth', str(self.webinspect_git_depth)] if self.webinspect_git_depth else []
+        if self.webinspect_git_revision:
+            check_output(['git', '-C', full_path, 'fetch'] + depth + ['origin', self.webinspect_git_revision])
+            check_output(['git', '-C', full_path, 'reset', '--hard', 'FETCH_HEAD'])
+        else:
+            check_output(['git', '-C', full_path, 'reset', '--hard'])
+            check_output(['git', '-C', full_path, 'pull', '--rebase'] + depth)
+        if sparse:
+            # Bring the working tree in line with sparse_paths, which may have changed since the last refresh
+            check_output(['git', '-C', full_path, 'read-tree', '-mu', 'HEAD'])
+
+    def __apply_sparse_checkout__(self, full_path):
+        """
+        Write sparse_paths to the sparse-checkout file of full_path, or every path once sparse_paths are removed
+        from an existing sparse checkout.
+        :return: True if full_path is a sparse checkout
+        """
+        sparse_path = os.path.join(full_path, '.git', 'info', 'sparse-checkout')
+        if self.webinspect_git_sparse_paths:
+            patterns = self.webinspect_git_sparse_paths
+        elif os.path.isfile(sparse_path):
+            patterns = ['/*']
+        else:
+            return False
+        if not os.path.isdir(os.path.dirname(sparse_path)):
+            os.makedirs(os.path.dirname(sparse_path))
+        check_output(['git', '-C', full_path, 'config', 'core.sparseCheckout', 'true'])
+        with open(sparse_path, 'w') as sparse_file:
+            sparse_file.write("\n".join(patterns) + "\n")
+        return True
+
+    def __webinspect_configs_current__(self, full_path, git_dir):
+        """
+        A checkout pinned to a full commit id never changes once it is checked out. Anything else is current
+        until refresh_ttl has passed since the last refresh.
+        """
+        if self.webinspect_git_revision and re.match('^[0-9a-fA-F]{40}$', self.webinspect_git_revision):
+            try:
+                head = check_output(['git', '-C', full_path, 'rev-parse', 'HEAD']).decode().strip()
+                return head.lower() == self.webinspect_git_revision.lower()
+            except CalledProcessError:
+                return False
+
+        stamp = os.path.join(git_dir, REPO_REFRESH_STAMP)
+        if not self.webinspect_git_ttl or not os.path.isfile(stamp):
+            return False
+        return time.time() - os.path.getmtime(stamp) < self.webinspect_git_ttl
+
+    @staticmethod
+    def __touch_refresh_stamp__(git_dir):
+        if os.path.isdir(git_dir):
+            with open(os.path.join(git_dir, REPO_REFRESH_STAMP), 'w') as stamp_file:
+                stamp_file.write(str(time.time()))
@@ -4,8 +4,8 @@
 import random
 import sys
 import time
-import webinspectapi.webinspect as webinspectapi
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.webinspectstatusservice import get_status_service
 
 
 class WebInspectJitScheduler(object):
@@ -14,6 +14,7 @@ class WebInspectJitScheduler(object):
         self.size_list = size_list
         self.size_needed = size_needed
         self.max_scans = self.__convert_size_to_count__()
+        self.status_service = get_status_service()
 
     def get_endpoint(self):
 
@@ -76,11 +77,10 @@ class WebInspectJitScheduler(object):
         :param endpoint: The endpoint to evaluate
         :param max_concurrent_scans:  The max number of allowed scans to be running on the endpoint
         """
-        api = webinspectapi.WebInspectApi(endpoint[0], verify_ssl=False)
-        response = api.list_scans()
+        scans = self.status_service.list_endpoint(endpoint[0])
         active_scans = 0
-        if response.success:
-            for scan in response.data:
+        if scans is not None:
+            for scan in scans:
                 if scan['Status'] == 'Running':
                     active_scans += 1
                     Logger.app.debug('Engine {} has {} active scans'.format(endpoint, str(active_scans)))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import os
 from webbreaker.webbreakerlogger import Logger
 
@@ -12,65 +13,73 @@ json_scan_settings = {
          }
     }
 
+crawl_audit_modes = {
+    "scan": "AuditOnly",
+    "crawl": "CrawlOnly",
+    "all": "CrawlAndAudit"
+}
+
+scan_scopes = {
+    "all": "Unrestricted",
+    "strict": "Self",
+    "children": "Children",
+    "ancestors": "Ancestors"
+}
+
+start_options = {
+    "url": "Url",
+    "macro": "Macro"
+}
+
 
 def formatted_settings_payload(settings, scan_name, runenv, scan_mode, scan_scope, login_macro, scan_policy,
                                scan_start, start_urls, workflow_macros, allowed_hosts):
+    """
+    Build the overrides payload for a new scan. A fresh payload is returned on every call and json_scan_settings
+    is only used as a template, so overrides never leak from one scan into the next and payloads for several
+    scans may be built concurrently.
+    """
+    payload = copy.deepcopy(json_scan_settings)
+    overrides = payload['overrides']
 
-    global json_scan_settings
-    json_scan_settings['settingsName'] = settings
+    payload['settingsName'] = settings
     # scanName option
     if runenv == "jenkins":
-        json_scan_settings['overrides']['scanName'] = os.getenv('BUILD_TAG')
+        overrides['scanName'] = os.getenv('BUILD_TAG')
     else:
-        json_scan_settings['overrides']['scanName'] = scan_name
+        overrides['scanName'] = scan_name
 
     # crawlAuditMode option
     if scan_mode:
-        json_scan_settings['overrides']['crawlAuditMode'] = ""
-        if scan_mode == "scan":
-            json_scan_settings['overrides']['crawlAuditMode'] = 'AuditOnly'
-        elif scan_mode == "crawl":
-            json_scan_settings['overrides']['crawlAuditMode'] = 'CrawlOnly'
-        else:
-            json_scan_settings['overrides']['crawlAuditMode'] = 'CrawlAndAudit'
+        # anything other than crawl or scan has always meant a full crawl and audit
+        overrides['crawlAuditMode'] = crawl_audit_modes.get(scan_mode, crawl_audit_modes['all'])
 
     if scan_scope:
-        json_scan_settings['overrides']['scanScope'] = ""
-        if scan_scope == "all":
-            json_scan_settings['overrides']['scanScope'] = 'Unrestricted'
-        elif scan_scope == "strict":
-            json_scan_settings['overrides']['scanScope'] = 'Self'
-        elif scan_scope == "children":
-            json_scan_settings['overrides']['scanScope'] = 'Children'
-        elif scan_scope == "ancestors":
-            json_scan_settings['overrides']['scanScope'] = 'Ancestors'
+        if scan_scope in scan_scopes:
+            overrides['scanScope'] = scan_scopes[scan_scope]
         else:
-            #json_scan_settings['overrides']['scanScope'] = 'None'
             Logger.app.error("Usage: all, strict, children, or ancestors are options! \n"
-                         "The value {} for scan_scope is not available!".format(scan_scope))
+                             "The value {} for scan_scope is not available!".format(scan_scope))
 
     if login_macro:
-        json_scan_settings['overrides']['loginMacro'] = login_macro
+        overrides['loginMacro'] = login_macro
 
     if scan_policy:
-        json_scan_settings['overrides']['policyId'] = scan_policy
+        overrides['policyId'] = scan_policy
 
     if scan_start:
-        json_scan_settings['overrides']['startOption'] = ""
-        if scan_start == "url":
-            json_scan_settings['overrides']['startOption'] = "Url"
-        elif scan_start == "macro":
-            json_scan_settings['overrides']['startOption'] = "Macro"
+        if scan_start in start_options:
+            overrides['startOption'] = start_options[scan_start]
         else:
             Logger.app.error("usage: url or macro are options NOT scan_start: {}!".format(scan_start))
 
     if start_urls:
-        json_scan_settings['overrides']['startUrls'] = start_urls
+        overrides['startUrls'] = list(start_urls)
 
     if workflow_macros:
-        json_scan_settings['overrides']['workflowMacros'] = workflow_macros
+        overrides['workflowMacros'] = list(workflow_macros)
 
     if allowed_hosts:
-        json_scan_settings['overrides']['allowedHosts'] = allowed_hosts
+        overrides['allowedHosts'] = list(allowed_hosts)
 
-    return json_scan_settings
+    return payload
@@ -4,7 +4,7 @@
 import json
 import ntpath
 import requests
-import webinspectapi.webinspect as webinspectapi
+from webbreaker.webinspectapiclient import WebInspectApi
 from webbreaker.webbreakerlogger import Logger
 from webbreaker.webbreakerhelper import WebBreakerHelper
 from webbreaker.webinspectconfig import WebInspectConfig
@@ -24,7 +24,7 @@ class WebinspectQueryClient(object):
         :param scan_name:
         :return: List of search results
         """
-        api = webinspectapi.WebInspectApi(self.host, verify_ssl=False)
+        api = WebInspectApi(self.host, verify_ssl=False)
         return api.get_scan_by_name(scan_name).data
 
     def export_scan_results(self, scan_id, scan_name, extension):
@@ -36,7 +36,7 @@ class WebinspectQueryClient(object):
         # Export scan as a xml for Threadfix or other Vuln Management System
         Logger.app.debug('Exporting scan: {}'.format(scan_id))
         detail_type = 'Full' if extension == 'xml' else None
-        api = webinspectapi.WebInspectApi(self.host, verify_ssl=False)
+        api = WebInspectApi(self.host, verify_ssl=False)
         response = api.export_scan_format(scan_id, extension, detail_type)
 
         if response.success:
@@ -54,23 +54,24 @@ class WebinspectQueryClient(object):
         """
         List all scans found on host
         :param scan_id:
-        :return:
+        :return: List of scans found on host
         """
-        api = webinspectapi.WebInspectApi(self.host, verify_ssl=False)
+        api = WebInspectApi(self.host, verify_ssl=False)
         response = api.list_scans()
         if response.success:
             for scan in response.data:
                 Logger.console.info("{0:80} {1:40} {2:10}".format(scan['Name'], scan['ID'], scan['Status']))
+            return response.data
         else:
             Logger.app.critical("{}".format(response.message))
+        return []
 
 
     def get_scan_status(self, scan_guid):
-        api = webinspectapi.WebInspectApi(self.host, verify_ssl=False)
+        api = WebInspectApi(self.host, verify_ssl=False)
         try:
             response = api.get_current_status(scan_guid)
-            status = json.loads(response.data_json())['ScanStatus']
-            return status
-        except (ValueError, TypeError, UnboundLocalError) as e:
+            return response.data['ScanStatus']
+        except (ValueError, TypeError, UnboundLocalError, KeyError) as e:
             Logger.app.error("get_scan_status failed: {}".format(e))
             return None
\ No newline at end of file
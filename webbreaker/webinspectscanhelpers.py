@@ -10,13 +10,24 @@ except ImportError:
     from urllib.parse import urlparse
 from webbreaker.webbreakerconfig import WebBreakerConfig
 from webbreaker.webbreakerlogger import Logger
+from webbreaker.webbreakermetrics import flush_metrics
 
 handle_scan_event = None
-reporter = WebBreakerConfig().create_reporter()
+reporter = None
+
+
+def get_reporter():
+    # Built on first use rather than at import, so importing this module doesn't read email.ini
+    global reporter
+    if reporter is None:
+        reporter = WebBreakerConfig().create_reporter()
+    return reporter
 
 
 # Use a closure for events related to scan status changes
 def create_scan_event_handler(webinspect_client, scan_id, webinspect_settings):
+    get_reporter()
+
     def scan_event_handler(event_type, external_termination=False):
         try:
             event = {}
@@ -32,13 +43,16 @@ def create_scan_event_handler(webinspect_client, scan_id, webinspect_settings):
             else:
                 event['targets'] = webinspect_settings['webinspect_scan_targets']
 
-            reporter.report(event)
+            get_reporter().report(event)
 
             if external_termination:
                 webinspect_client.stop_scan(scan_id)
         except Exception as e:
-            Logger.console.error("Oh no: {}".format(e.message))
+            Logger.console.error("Oh no: {}".format(e))
 
+    # write_end_event reports through the handler of the running scan
+    global handle_scan_event
+    handle_scan_event = scan_event_handler
     return scan_event_handler
 
 
@@ -47,7 +61,12 @@ def create_scan_event_handler(webinspect_client, scan_id, webinspect_settings):
 # handle that as a scan-end event prior to terminating. So, this function will be called by the python signal
 # handler within the scan-running context.
 def write_end_event(*args):
-    handle_scan_event('scan_end', external_termination=True)
+    if handle_scan_event:
+        handle_scan_event('scan_end', external_termination=True)
+    # os._exit skips the atexit handlers that would send the queued scan_end notification and write the metrics
+    if reporter:
+        reporter.flush()
+    flush_metrics()
     os._exit(0)
 
 
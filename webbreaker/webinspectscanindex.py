@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import datetime
+import threading
+from webbreaker.webbreakerlogger import Logger
+
+SCAN_INDEX_DB = os.path.abspath(os.path.join('webbreaker', 'etc', 'webinspect_scans.db'))
+
+
+class WebInspectScanIndex(object):
+    """
+    Local SQLite index of WebInspect scans (name, id, server, status, start/end time). Populated from the scans
+    WebBreaker launches and from the list_scans responses WebBreaker already receives while talking to the farm,
+    so a scan name can be resolved to the server that ran it without querying every server.
+    """
+    def __init__(self, db_path=SCAN_INDEX_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = None
+        try:
+            self.connection = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS scans ("
+                                        "scan_id TEXT PRIMARY KEY, "
+                                        "scan_name TEXT, "
+                                        "server TEXT, "
+                                        "status TEXT, "
+                                        "start_time TEXT, "
+                                        "end_time TEXT, "
+                                        "updated TEXT)")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS scans_name ON scans (scan_name)")
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to open the WebInspect scan index {0}: {1}".format(self.db_path, e))
+            self.connection = None
+
+    def record_scan(self, scan_id, scan_name, server, status='Running', start_time=None):
+        """
+        Add (or replace) a scan launched by WebBreaker.
+        """
+        if not start_time:
+            start_time = datetime.datetime.now().isoformat()
+        self.__execute__([("INSERT OR REPLACE INTO scans (scan_id, scan_name, server, status, start_time, end_time, "
+                           "updated) VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                           (scan_id, scan_name, server, status, start_time, self.__now__()))])
+
+    def update_status(self, scan_id, status, end_time=None):
+        self.__execute__([("UPDATE scans SET status = ?, end_time = COALESCE(?, end_time), updated = ? "
+                           "WHERE scan_id = ?", (status, end_time, self.__now__(), scan_id))])
+
+    def refresh(self, server, scans):
+        """
+        Incrementally merge a list_scans (or get_scan_by_name) response from server into the index. Only rows
+        that are new or whose status changed are written.
+        :param server: URL of the WebInspect server the scans were listed from
+        :param scans: List of scan dicts as returned by the WebInspect API (ID, Name, Status, StartTime)
+        """
+        if not scans:
+            return
+        now = self.__now__()
+        statements = []
+        for scan in scans:
+            try:
+                statements.append(("INSERT OR IGNORE INTO scans (scan_id, scan_name, server, status, start_time, "
+                                    "updated) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (scan['ID'], scan['Name'], server, scan['Status'], scan.get('StartTime'), now)))
+                statements.append(("UPDATE scans SET status = ?, server = ?, updated = ? "
+                                   "WHERE scan_id = ? AND (status IS NOT ? OR server IS NOT ?)",
+                                   (scan['Status'], server, now, scan['ID'], scan['Status'], server)))
+            except (KeyError, TypeError, AttributeError) as e:
+                Logger.app.debug("Skipping malformed scan entry from {0}: {1}".format(server, e))
+        self.__execute__(statements)
+
+    def find_by_name(self, scan_name):
+        """
+        :param scan_name: Name of the scan to look up
+        :return: List of matching scans, newest first, in the same shape as the WebInspect API plus the server
+        """
+        return self.__query__("SELECT * FROM scans WHERE scan_name = ? ORDER BY start_time DESC", (scan_name,))
+
+    def find_by_id(self, scan_id):
+        results = self.__query__("SELECT * FROM scans WHERE scan_id = ?", (scan_id,))
+        if results:
+            return results[0]
+        return None
+
+    def __execute__(self, statements):
+        if not self.connection or not statements:
+            return
+        try:
+            with self.lock:
+                with self.connection:
+                    for statement, parameters in statements:
+                        self.connection.execute(statement, parameters)
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to update the WebInspect scan index {0}: {1}".format(self.db_path, e))
+
+    def __query__(self, statement, parameters):
+        if not self.connection:
+            return []
+        try:
+            with self.lock:
+                rows = self.connection.execute(statement, parameters).fetchall()
+        except sqlite3.Error as e:
+            Logger.app.error("Unable to read the WebInspect scan index {0}: {1}".format(self.db_path, e))
+            return []
+        return [{'ID': row['scan_id'],
+                 'Name': row['scan_name'],
+                 'Server': row['server'],
+                 'Status': row['status'],
+                 'StartTime': row['start_time'],
+                 'EndTime': row['end_time']} for row in rows]
+
+    @staticmethod
+    def __now__():
+        return datetime.datetime.now().isoformat()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from webbreaker.webinspectapiclient import WebInspectApi
+from webbreaker.webbreakerlogger import Logger
+from webbreaker.webinspectscanindex import WebInspectScanIndex
+
+# Seconds a listed status is served to scan_status before the endpoint is listed again
+STATUS_MAX_AGE = 5
+
+_status_service = None
+_status_service_lock = threading.Lock()
+
+
+class WebInspectStatusService(object):
+    """
+    Tracks the status of any number of scans with a single list_scans request per WebInspect endpoint per poll
+    cycle, instead of one get_current_status request per scan.
+    """
+    def __init__(self, scan_index=None):
+        self.scan_index = scan_index if scan_index else WebInspectScanIndex()
+        self.subscriptions = {}
+        self.statuses = {}
+        self.listed = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, endpoint, scan_id):
+        with self.lock:
+            self.subscriptions.setdefault(endpoint, set()).add(scan_id)
+
+    def unsubscribe(self, scan_id):
+        with self.lock:
+            for endpoint in list(self.subscriptions):
+                self.subscriptions[endpoint].discard(scan_id)
+                if not self.subscriptions[endpoint]:
+                    del self.subscriptions[endpoint]
+            self.statuses.pop(scan_id, None)
+
+    def get_status(self, scan_id):
+        """
+        :return: Status of scan_id as of the last poll, or None if it has not been seen yet
+        """
+        with self.lock:
+            return self.statuses.get(scan_id)
+
+    def scan_status(self, endpoint, scan_id, max_age=STATUS_MAX_AGE):
+        """
+        Subscribe to scan_id and return its status. endpoint is only listed again when its last listing is older
+        than max_age seconds, so lookups of every scan on an endpoint share one list_scans call.
+        :return: Status of scan_id, or None if it is not listed on endpoint
+        """
+        self.subscribe(endpoint, scan_id)
+        with self.lock:
+            fresh = scan_id in self.statuses and time.time() - self.listed.get(endpoint, 0) < max_age
+        if not fresh:
+            self.list_endpoint(endpoint)
+        return self.get_status(scan_id)
+
+    def poll(self):
+        """
+        Refresh the status of every subscribed scan, one list_scans call per endpoint.
+        :return: dict of scan_id to status for all subscribed scans seen on their endpoint
+        """
+        with self.lock:
+            subscriptions = dict((endpoint, set(scan_ids)) for endpoint, scan_ids in self.subscriptions.items())
+
+        polled = {}
+        for endpoint, scan_ids in subscriptions.items():
+            self.list_endpoint(endpoint)
+            with self.lock:
+                polled.update((scan_id, self.statuses[scan_id]) for scan_id in scan_ids if scan_id in self.statuses)
+        return polled
+
+    def list_endpoint(self, endpoint):
+        """
+        List all scans on endpoint and record them in the local scan index. The statuses of the scans subscribed to
+        on endpoint are updated from the same listing.
+        :return: List of scans on endpoint, or None if the endpoint could not be queried
+        """
+        try:
+            api = WebInspectApi(endpoint, verify_ssl=False)
+            response = api.list_scans()
+        except (ValueError, UnboundLocalError, TypeError) as e:
+            Logger.app.error("list_scans failed on {0}: {1}".format(endpoint, e))
+            return None
+
+        if not response.success:
+            Logger.app.error("list_scans failed on {0}: {1}".format(endpoint, response.message))
+            return None
+
+        self.scan_index.refresh(endpoint, response.data)
+        with self.lock:
+            self.listed[endpoint] = time.time()
+            scan_ids = self.subscriptions.get(endpoint, set())
+            for scan in response.data:
+                if scan.get('ID') in scan_ids:
+                    self.statuses[scan['ID']] = scan.get('Status')
+        return response.data
+
+
+def get_status_service():
+    """
+    :return: The WebInspectStatusService shared by every client in this process
+    """
+    global _status_service
+    with _status_service_lock:
+        if _status_service is None:
+            _status_service = WebInspectStatusService()
+        return _status_service